@@ -0,0 +1,5 @@
+#!/bin/bash
+
+export PYTHONPATH=../
+
+python -m jump.benchmark "$@"
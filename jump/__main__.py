@@ -1,89 +1,297 @@
 import argparse
+import asyncio
 import csv
+import os
 import sys
-from typing import List, IO
+from contextlib import ExitStack
+from typing import IO, Iterator, Optional
 
 from jump.book import Book
+from jump.checkpoint import Checkpoint, Checkpointer, read_checkpoint
 from jump.error import *
-from jump.feed_processor import ProcessorFactory
+from jump.feed_reader import ByteLines, FeedPosition, compression, csv_feed, open_feed
+from jump.merge import merge_feed
+from jump.network import AsyncWriter, FeedServer
+from jump.pipeline import Pipeline
+from jump.shard import replay_symbols
+from jump.stats import Stats
+from jump.tick import TickSize
+from jump.sink import ConflatingSink, NullSink, OutputSink, TextSink, create_sink
 
 
 def main():
     parser = argparse.ArgumentParser(description="Feed processor that reads messages from stdin")
     parser.add_argument('-f', '--infile', help='Input csv file, uses stdin if not present', type=str, required=False)
+    parser.add_argument('--merge', help='Replay several csv files whose rows start with a sequence number, merged in '
+                                        'sequence order', type=str, nargs='+', required=False)
     parser.add_argument('-o', '--outfile', help='Output file, prints to stdout if not present', type=str,
                         required=False)
     parser.add_argument('-n', '--nostate', help='Do not output book state', action='store_true', required=False)
     parser.add_argument('-t', '--notrade', help='Do not output trades', action='store_true', required=False)
+    parser.add_argument('--fill', help='Decrement resting orders matched by trades', action='store_true',
+                        required=False)
+    parser.add_argument('--format', help='Output format', choices=('text', 'binary', 'null'), default='text',
+                        required=False)
+    parser.add_argument('--buffer-size', help='Characters/bytes of output to buffer between writes, 0 to write '
+                                              'every record through', type=int, default=1 << 16, required=False)
+    parser.add_argument('--delta', help='Between full book dumps, output only the levels changed since the previous '
+                                        'dump, with a full dump every DELTA dumps', type=int, default=0,
+                        required=False)
+    parser.add_argument('--symbols', help='Rows start with a symbol column, keep a book per symbol',
+                        action='store_true', required=False)
+    parser.add_argument('--workers', help='With --symbols, shard the symbols over this many processes', type=int,
+                        default=0, required=False)
+    parser.add_argument('--stats', help='Time the replay and print a report to stderr', action='store_true',
+                        required=False)
+    parser.add_argument('--stats-json', help='Time the replay and write the report as json to this file', type=str,
+                        required=False)
+    parser.add_argument('--reject-samples', help='Print this many of the most recent rejected messages to stderr',
+                        type=int, default=0, required=False)
+    parser.add_argument('--tick-size', help='Price increment, prices that are not a whole number of ticks are '
+                                            'rejected. Without it prices are kept as given, to 9 decimal places',
+                        type=str, required=False)
+    parser.add_argument('--tape-size', help='Most recent trades kept on the trade tape', type=int, default=1024,
+                        required=False)
+    parser.add_argument('--checkpoint', help='Save the book to this file every --checkpoint-every messages',
+                        type=str, required=False)
+    parser.add_argument('--checkpoint-every', help='Messages between checkpoints, a multiple of 10', type=int,
+                        default=100000, required=False)
+    parser.add_argument('--resume', help='Load the book from this checkpoint and carry on from where it was taken',
+                        type=str, required=False)
+    parser.add_argument('--pipeline', help='Parse and format in separate threads or processes, applying messages to '
+                                           'the book in between', choices=('thread', 'process'), required=False)
+    parser.add_argument('--midquote-changes', help='Only output the midquote when it changes', action='store_true',
+                        required=False)
+    parser.add_argument('--midquote-every', help='Only output the last midquote of every N messages', type=int,
+                        default=1, required=False)
+    parser.add_argument('--coalesce-trades', help='Output a run of trades at the same price as one line with its '
+                                                  'total', action='store_true', required=False)
+    parser.add_argument('--tcp', help='Read the feed from publishers connecting to this tcp port instead of a file',
+                        type=int, required=False)
+    parser.add_argument('--udp', help='Read the feed from datagrams sent to this udp port instead of a file', type=int,
+                        required=False)
+    parser.add_argument('--host', help='Address --tcp and --udp listen on', type=str, default='127.0.0.1',
+                        required=False)
+    parser.add_argument('--publishers', help='With --tcp, stop once this many publishers have disconnected, 0 to run '
+                                             'until interrupted', type=int, default=0, required=False)
     args = vars(parser.parse_args())
+    try:
+        args['tick_size'] = TickSize(args['tick_size'])
+    except (ValueError, ZeroDivisionError):
+        parser.error('--tick-size must be a positive decimal')
+    if args['tape_size'] < 0:
+        parser.error('--tape-size must not be negative')
+    if args['delta'] < 0:
+        parser.error('--delta must not be negative')
+    if args['buffer_size'] < 0:
+        parser.error('--buffer-size must not be negative')
+    if args['infile'] and (args['checkpoint'] or args['resume']) and compression(args['infile']):
+        parser.error('--checkpoint and --resume need an uncompressed --infile')
+    network = args['tcp'] is not None or args['udp'] is not None
+    if network and (args['infile'] or args['symbols'] or args['pipeline'] or args['stats'] or args['stats_json'] or
+                    args['checkpoint'] or args['resume']):
+        parser.error('--tcp and --udp only support plain replays, without --infile, --symbols, --pipeline, --stats, '
+                     '--checkpoint or --resume')
+    if args['merge'] and (args['infile'] or args['symbols'] or args['pipeline'] or network or args['checkpoint'] or
+                          args['resume']):
+        parser.error('--merge only supports plain replays, without --infile, --symbols, --pipeline, --tcp, --udp, '
+                     '--checkpoint or --resume')
+    if args['publishers'] and args['tcp'] is None:
+        parser.error('--publishers requires --tcp')
+    policies = args['midquote_changes'] or args['midquote_every'] != 1 or args['coalesce_trades']
+    if args['midquote_every'] < 1:
+        parser.error('--midquote-every must be positive')
+    if policies and (args['symbols'] or args['checkpoint'] or args['resume']):
+        parser.error('--midquote-changes, --midquote-every and --coalesce-trades are not supported with --symbols, '
+                     '--checkpoint or --resume')
+    if args['symbols']:
+        if args['format'] == 'binary':
+            parser.error('--symbols only supports text or null output')
+        if args['stats'] or args['stats_json']:
+            parser.error('--stats is not supported with --symbols')
+        if args['reject_samples']:
+            parser.error('--reject-samples is not supported with --symbols')
+        if args['checkpoint'] or args['resume']:
+            parser.error('--checkpoint and --resume are not supported with --symbols')
+        if args['pipeline']:
+            parser.error('--pipeline is not supported with --symbols')
+        if args['workers'] < 0:
+            parser.error('--workers must not be negative')
+        return main_symbols(args)
+    elif args['workers']:
+        parser.error('--workers requires --symbols')
+    if args['checkpoint'] or args['resume']:
+        if not args['infile']:
+            parser.error('--checkpoint and --resume require --infile')
+        if args['stats'] or args['stats_json']:
+            parser.error('--stats is not supported with --checkpoint or --resume')
+        if args['checkpoint_every'] <= 0 or args['checkpoint_every'] % 10:
+            parser.error('--checkpoint-every must be a positive multiple of 10')
+    if args['pipeline']:
+        if args['stats'] or args['stats_json'] or args['checkpoint'] or args['resume']:
+            parser.error('--pipeline is not supported with --stats, --checkpoint or --resume')
+        if args['pipeline'] == 'process' and not args['infile']:
+            parser.error('--pipeline process requires --infile')
+
+    book = Book(fill_trades=args['fill'], full_snapshot_every=args['delta'], reject_samples=args['reject_samples'],
+                tape_capacity=args['tape_size'], tick_size=args['tick_size'])
+    if args['pipeline']:
+        return main_pipeline(args, book)
+    if network:
+        return main_network(args, book)
+    checkpoint = read_checkpoint(args['resume'], book) if args['resume'] else None
+    sink = create_sink(args['format'], args['outfile'], args['buffer_size'],
+                       append=resume_output(args['outfile'], checkpoint), decimals=args['tick_size'].decimals)
+    book.sink = conflate(args, sink)
+
+    stats = Stats() if args['stats'] or args['stats_json'] else None
+
+    if args['checkpoint'] or checkpoint is not None:
+        start = checkpoint.input_offset if checkpoint is not None else 0
+        position = FeedPosition(start)
+        checkpointer = None
+        if args['checkpoint']:
+            output = sink.file if args['outfile'] and args['format'] != 'null' else None
+            checkpointer = Checkpointer(args['checkpoint'], args['checkpoint_every'], position, output)
+        messages = checkpoint.messages if checkpoint is not None else 0
+        with open(args['infile'], 'rb') as f:
+            f.seek(start)
+            replay(csv_feed(ByteLines(f, position), book), book, not args['nostate'], checkpointer=checkpointer,
+                   messages=messages)
+    elif args['merge']:
+        with ExitStack() as stack:
+            feed = merge_feed([stack.enter_context(open_feed(path)) for path in args['merge']], book)
+            replay(stats.wrap(feed) if stats else feed, book, not args['nostate'], stats=stats)
+    else:
+        infile = open_feed(args['infile']) if args['infile'] else sys.stdin
+        with infile as f:
+            replay(stats.csv_feed(f, book) if stats else csv_feed(f, book), book, not args['nostate'], stats=stats)
+    report_errors(book.rejects, book.sink)
+    book.sink.flush()
+    report_samples(book.rejects, sys.stderr)
+
+    if stats and args['stats']:
+        stats.report(sys.stderr)
+    if stats and args['stats_json']:
+        with open(args['stats_json'], 'w') as f:
+            stats.write_json(f)
+
+
+def main_pipeline(args: dict, book: Book):
+    with Pipeline(args['infile'] or sys.stdin, args['outfile'], args['format'], args['buffer_size'],
+                  use_process=args['pipeline'] == 'process', decimals=args['tick_size'].decimals) as pipeline:
+        book.sink = conflate(args, pipeline.sink)
+        replay(pipeline.feed(book), book, not args['nostate'])
+        report_errors(book.rejects, book.sink)
+    report_samples(book.rejects, sys.stderr)
+
+
+def main_network(args: dict, book: Book):
+    sink = create_sink(args['format'], args['outfile'], args['buffer_size'], decimals=args['tick_size'].decimals)
+    writer = None
+    if not isinstance(sink, NullSink):
+        writer = sink.file = AsyncWriter(sink.file)
+    book.sink = conflate(args, sink)
+    server = FeedServer(book, not args['nostate'], writer)
+    try:
+        asyncio.run(serve(server, args))
+    except KeyboardInterrupt:
+        pass
+    if server.dropped:
+        sys.stderr.write("Dropped {} datagrams\n".format(server.dropped))
+    report_samples(book.rejects, sys.stderr)
+
 
-    outfile = open(args['outfile'], 'w') if args['outfile'] else sys.stdout
-    infile = open(args['infile'], 'r') if args['infile'] else sys.stdin
-    book = Book(file=outfile)
+async def serve(server: FeedServer, args: dict):
+    await server.start(args['host'], args['tcp'], args['udp'])
+    try:
+        if args['publishers']:
+            await server.wait_publishers(args['publishers'])
+        else:
+            await asyncio.Event().wait()
+    finally:
+        # also reached on ctrl-c, which cancels the wait, so the output still ends with the book and ERRORS
+        await server.stop()
 
+
+def main_symbols(args: dict):
+    outfile = None
+    if args['format'] != 'null':
+        outfile = open(args['outfile'], 'w') if args['outfile'] else sys.stdout
+    infile = open_feed(args['infile']) if args['infile'] else sys.stdin
     with infile as f:
-        reader = csv.reader(f)
-        ctr = 0
-        errors = []
-        for message in reader:
-            try:
-                processor = ProcessorFactory.create_processor(message, book)
-                processor.process(message)
-            except (InvalidOrderError, DuplicateOrderError, OrderDoesNotExistError, TradeNotMatchedError,
-                    InvalidMessageError) as e:
-                errors.append(e)
-
-            book.midquote(outfile)
-            ctr += 1
-            if not ctr % 10 and not args['nostate']:
-                book.output_state(outfile)
-
-        try:
-            book.expected_trades()
-        except BestPriceButNoTradeError as e:
-            errors.append(e)
-
-        if not args['nostate']:
-            book.output_state(outfile)
-        report_errors(errors, outfile)
-
-
-def report_errors(errors: List[Exception], file: IO):
-    a = 0
-    b = 0
-    c = 0
-    d = 0
-    e = 0
-    f = 0
-
-    for error in errors:
-        error_type = type(error)
-        if error_type == InvalidMessageError:
-            a += 1
-        elif error_type == DuplicateOrderError:
-            b += 1
-        elif error_type == TradeNotMatchedError:
-            c += 1
-        elif error_type == OrderDoesNotExistError:
-            d += 1
-        elif error_type == BestPriceButNoTradeError:
-            e += 1
-        elif error_type == InvalidOrderError:
-            f += 1
-
-    file.write("ERRORS:\n")
-    if a:
-        file.write("a,{}\n".format(a))
-    if b:
-        file.write("b,{}\n".format(b))
-    if c:
-        file.write("c,{}\n".format(c))
-    if d:
-        file.write("d,{}\n".format(d))
-    if e:
-        file.write("e,{}\n".format(e))
-    if f:
-        file.write("f,{}\n".format(f))
+        counts = replay_symbols(csv.reader(f), outfile, workers=args['workers'], fill_trades=args['fill'],
+                                full_snapshot_every=args['delta'], state=not args['nostate'],
+                                buffer_size=args['buffer_size'], tick_size=args['tick_size'],
+                                tape_capacity=args['tape_size'])
+    sink = TextSink(outfile) if outfile is not None else NullSink()
+    sink.errors(counts)
+    sink.flush()
+
+
+def conflate(args: dict, sink: OutputSink) -> OutputSink:
+    """Wrap the sink in the midquote and trade output policies asked for, if any."""
+    if not (args['midquote_changes'] or args['midquote_every'] != 1 or args['coalesce_trades']):
+        return sink
+    return ConflatingSink(sink, changes_only=args['midquote_changes'], every=args['midquote_every'],
+                          coalesce_trades=args['coalesce_trades'])
+
+
+def resume_output(path: Optional[str], checkpoint: Optional[Checkpoint]) -> bool:
+    """Cut the output file back to where the checkpoint was taken, returns True if it should be appended to."""
+    if checkpoint is None or checkpoint.output_offset < 0 or not path or not os.path.exists(path):
+        return False
+    with open(path, 'r+b') as f:
+        f.truncate(checkpoint.output_offset)
+    return True
+
+
+def replay(feed: Iterator[Optional[str]], book: Book, state: bool = True, stats: Optional[Stats] = None,
+           checkpointer: Optional[Checkpointer] = None, messages: int = 0):
+    """
+    Run the feed through the book, writing the midquote after every message and the book every 10 messages.
+
+    messages is the count already replayed before a resume, so snapshots and checkpoints keep their cadence.
+    """
+    if stats is not None:
+        return stats.replay(feed, book, state)
+
+    replay_messages(feed, book, state, messages, checkpointer)
+    finish_replay(book, state)
+
+
+def replay_messages(feed: Iterator[Optional[str]], book: Book, state: bool = True, messages: int = 0,
+                    checkpointer: Optional[Checkpointer] = None) -> int:
+    """The output after each message of the feed, counting on from messages; returns the count reached."""
+    ctr = messages
+    midquote = book.midquote
+    for _ in feed:
+        midquote()
+        ctr += 1
+        if not ctr % 10:
+            if state:
+                book.snapshot()
+            if checkpointer is not None and not ctr % checkpointer.every:
+                checkpointer.save(book, ctr)
+    return ctr
+
+
+def finish_replay(book: Book, state: bool = True):
+    """The output at the end of the feed, before the ERRORS summary."""
+    book.check_expected_trades()
+    if state:
+        book.output_state()
+
+
+def report_errors(rejects: Rejects, sink: OutputSink):
+    sink.errors(rejects.counts)
+
+
+def report_samples(rejects: Rejects, file: IO):
+    if rejects.samples:
+        file.write("REJECTS:\n")
+        for code, message in rejects.samples:
+            file.write("{},{}\n".format(code, ",".join(message) if isinstance(message, list) else message or ''))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+import math
+from array import array
+from itertools import compress
+from typing import Dict, Iterable, List, Optional
+
+from jump.book import Book
+from jump.error import *
+from jump.feed_reader import open_feed
+from jump.order import Order
+from jump.sink import OutputSink
+from jump.tick import TickSize
+from jump.trade import Trade
+
+ORDER = 1
+TRADE = 2
+# the action field of a well formed order row, with its separator
+ORDER_PREFIXES = (b'A,', b'X,', b'M,')
+ACTIONS = {b'A': Order.ACTION_ADD, b'X': Order.ACTION_REMOVE, b'M': Order.ACTION_MODIFY}
+SIDES = {b'B': Order.BUY_SIDE, b'S': Order.SELL_SIDE}
+
+
+class FeedColumns(object):
+    """
+    A chunk of feed rows converted column by column.
+
+    kinds has one entry per row: ORDER for well formed add/cancel/modify rows, TRADE for well formed trades and 0
+    for anything that is not a valid message. The order and trade columns hold the fields of those rows only, in
+    feed order. All the order rows are joined and split in one go, so each column is a strided slice of the fields
+    converted with a single map(); valid is Order.is_valid mapped over the columns the same way. sides holds None
+    for anything but B or S, which is_valid then refuses. Prices are converted to ticks of tick_size, the price
+    columns are lists so they can hold None for a price that is off the ticks or not finite.
+    """
+
+    def __init__(self, lines: List[bytes], tick_size: TickSize):
+        super().__init__()
+        self.lines = lines
+        kinds = [ORDER if line[:2] in ORDER_PREFIXES and line.count(b',') == 4 else
+                 TRADE if line[:2] == b'T,' and line.count(b',') == 2 else 0 for line in lines]
+        self.kinds = bytes(kinds)
+
+        fields = b','.join(compress(lines, [kind == ORDER for kind in kinds])).split(b',') if ORDER in kinds else []
+        self.actions = list(map(ACTIONS.__getitem__, fields[0::5]))
+        self.ids = array('q', map(int, fields[1::5]))
+        self.sides = list(map(SIDES.get, fields[2::5]))
+        self.quantities = array('q', map(int, fields[3::5]))
+        self.prices = list(map(tick_size.to_ticks, fields[4::5]))
+        self.valid = bytes(map(Order.is_valid, self.ids, self.sides, self.prices, self.quantities))
+
+        fields = b','.join(compress(lines, [kind == TRADE for kind in kinds])).split(b',') if TRADE in kinds else []
+        self.trade_quantities = array('q', map(int, fields[1::3]))
+        self.trade_prices = list(map(tick_size.to_ticks, fields[2::3]))
+
+    def __len__(self):
+        return len(self.kinds)
+
+
+class SeriesSink(OutputSink):
+    """
+    Collects the midquote after every message and every trade line into arrays, dropping book dumps.
+
+    midquotes has one entry per message, NaN where Book.midquote reports none. The trade columns hold what the
+    text output prints for each trade, quantity@price, and the index of the message that printed it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.midquotes = array('d')
+        self.trade_messages = array('q')
+        self.trade_quantities = array('q')
+        self.trade_prices = array('d')
+
+    def midquote(self, mid: Optional[float]):
+        self.midquotes.append(mid if mid is not None else math.nan)
+
+    def trade(self, quantity: int, price: float):
+        # the book reports a trade before the midquote of the message that carried it
+        self.trade_messages.append(len(self.midquotes))
+        self.trade_quantities.append(quantity)
+        self.trade_prices.append(price)
+
+    def state(self, sells: Iterable, buys: Iterable):
+        pass
+
+    def delta(self, sells: Iterable, buys: Iterable):
+        pass
+
+    def errors(self, counts: Dict[str, int]):
+        pass
+
+
+def batch_replay(path: str, book: Optional[Book] = None, chunk_size: int = 1 << 20) -> SeriesSink:
+    """
+    Replay a feed file for its midquote and trade series, reading it chunk_size bytes at a time.
+
+    Each chunk is loaded into FeedColumns and applied to the book straight from the columns, without a message
+    list per row, without the processors and without book dumps. The series are the same as the midquote and trade
+    output of python -m jump for the plain, unquoted feeds the exchange sends. The arrays support the buffer
+    protocol, so numpy.frombuffer() can wrap them without a copy.
+    """
+    series = SeriesSink()
+    if book is None:
+        book = Book()
+    book.sink = series
+    with open_feed(path, binary=True) as f:
+        rest = b''
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            data = rest + block
+            # only whole lines are applied, a partial last line waits for the next block
+            cut = data.rfind(b'\n')
+            if cut == -1:
+                rest = data
+                continue
+            rest = data[cut + 1:]
+            apply_columns(FeedColumns(split_lines(data[:cut]), book.tick_size), book, series)
+        if rest:
+            apply_columns(FeedColumns(split_lines(rest), book.tick_size), book, series)
+    book.check_expected_trades()
+    return series
+
+
+def split_lines(data: bytes) -> List[bytes]:
+    lines = data.split(b'\n')
+    if b'\r' in data:
+        lines = [line[:-1] if line[-1:] == b'\r' else line for line in lines]
+    return lines
+
+
+def apply_columns(columns: FeedColumns, book: Book, series: SeriesSink):
+    rejects = book.rejects
+    apply_add, apply_remove, apply_modify, apply_trade = (book.apply_add, book.apply_remove, book.apply_modify,
+                                                          book.apply_trade)
+    # the midquote is worked out as in Book.midquote and appended straight to the series, skipping the sink call
+    best_bid, best_ask = book.bids.best_price, book.asks.best_price
+    midpoint = book.tick_size.midpoint
+    midquotes = series.midquotes
+    nan = math.nan
+    orders = zip(columns.actions, columns.ids, columns.sides, columns.quantities, columns.prices, columns.valid)
+    trades = zip(columns.trade_quantities, columns.trade_prices)
+    for i, kind in enumerate(columns.kinds):
+        if kind == ORDER:
+            action, order_id, side, quantity, price, valid = next(orders)
+            if not valid:
+                code = INVALID_ORDER
+            elif action == Order.ACTION_ADD:
+                code = apply_add(Order(id=order_id, side=side, quantity=quantity, price=price, action=action))
+            elif action == Order.ACTION_REMOVE:
+                code = apply_remove(order_id, side, quantity, price)
+            else:
+                code = apply_modify(order_id, side, quantity, price)
+        elif kind == TRADE:
+            quantity, price = next(trades)
+            code = apply_trade(Trade(quantity=quantity, price=price))
+        else:
+            code = INVALID_MESSAGE
+        if code:
+            line = columns.lines[i].decode(errors='replace')
+            rejects.record(code, line.split(',') if line else [])
+        bb = best_bid()
+        bs = best_ask()
+        midquotes.append(midpoint(bb, bs) if bb is not None and bs is not None else nan)
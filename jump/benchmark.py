@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional
+
+from jump.__main__ import replay as replay_feed
+from jump.book import Book
+from jump.feed_processor import MessageDispatcher
+from jump.generator import FeedGenerator
+from jump.sink import TextSink
+
+# latency buckets reported besides the message types
+MIDQUOTE = 'midquote'
+SNAPSHOT = 'snapshot'
+PERCENTILES = (50, 90, 99)
+
+
+def feed(rows: List[List[str]], book: Book) -> Iterator[Optional[str]]:
+    """csv_feed over rows already in memory, so the benchmark does not time the csv parsing."""
+    dispatch = MessageDispatcher(book).dispatch
+    for message in rows:
+        yield dispatch(message)
+
+
+def replay(rows: List[List[str]], book: Book):
+    """The rows through the replay loop of python -m jump, without any timing."""
+    replay_feed(feed(rows, book), book)
+
+
+def timed_replay(rows: List[List[str]], book: Book) -> Dict[str, List[int]]:
+    """
+    The same replay with every step timed, latencies in nanoseconds keyed by message type or output step.
+
+    The dispatch of each row is timed by the feed, the book's midquote and snapshot by wrappers the replay loop
+    calls in their place.
+    """
+    clock = time.perf_counter_ns
+    latencies = {}
+    midquotes = latencies[MIDQUOTE] = []
+    snapshots = latencies[SNAPSHOT] = []
+    midquote, snapshot = book.midquote, book.snapshot
+
+    def timed_midquote():
+        start = clock()
+        midquote()
+        midquotes.append(clock() - start)
+
+    def timed_snapshot():
+        start = clock()
+        snapshot()
+        snapshots.append(clock() - start)
+
+    def timed_feed() -> Iterator[Optional[str]]:
+        dispatch = MessageDispatcher(book).dispatch
+        for message in rows:
+            action = message[0] if message and message[0] in ('A', 'X', 'M', 'T') else 'bad'
+            start = clock()
+            code = dispatch(message)
+            latencies.setdefault(action, []).append(clock() - start)
+            yield code
+
+    book.midquote = timed_midquote
+    book.snapshot = timed_snapshot
+    replay_feed(timed_feed(), book)
+    return latencies
+
+
+def percentiles(samples: List[int]) -> Dict[str, int]:
+    samples = sorted(samples)
+    result = {'count': len(samples)}
+    for p in PERCENTILES:
+        result['p{}'.format(p)] = samples[min(len(samples) - 1, len(samples) * p // 100)]
+    result['max'] = samples[-1]
+    return result
+
+
+def benchmark(rows: List[List[str]], memory: bool = True, repeat: int = 3) -> dict:
+    with open(os.devnull, 'w') as devnull:
+        # best of several runs, the slower ones mostly measure other load on the machine
+        elapsed = None
+        for _ in range(repeat):
+            book = Book(sink=TextSink(devnull))
+            start = time.perf_counter()
+            replay(rows, book)
+            run = time.perf_counter() - start
+            elapsed = run if elapsed is None else min(elapsed, run)
+
+        result = {
+            'messages': len(rows),
+            'seconds': elapsed,
+            'msg_per_sec': len(rows) / elapsed if elapsed else 0.0,
+            'orders': len(book.orders),
+            'levels': len(book.bids) + len(book.asks),
+            'latency_ns': {name: percentiles(samples) for name, samples in
+                           sorted(timed_replay(rows, Book(sink=TextSink(devnull))).items()) if samples},
+        }
+
+        if memory:
+            tracemalloc.start()
+            replay(rows, Book(sink=TextSink(devnull)))
+            result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+            tracemalloc.stop()
+    return result
+
+
+def report(results: Dict[str, dict], file):
+    for size, result in results.items():
+        file.write("{} messages: {:.0f} msg/s, {} orders in {} levels".format(
+            size, result['msg_per_sec'], result['orders'], result['levels']))
+        if 'peak_memory_mb' in result:
+            file.write(", peak {:.1f} MB".format(result['peak_memory_mb']))
+        file.write("\n")
+        for name, stats in result['latency_ns'].items():
+            file.write("  {:<9}{:>10}  {}\n".format(name, stats['count'], "  ".join(
+                "{}={}ns".format(key, stats[key]) for key in ['p{}'.format(p) for p in PERCENTILES] + ['max'])))
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float, file) -> bool:
+    """Print throughput and p50 latency against the baseline, returns False if throughput regressed."""
+    ok = True
+    for size, result in results.items():
+        base = baseline.get(size)
+        if not base:
+            file.write("{} messages: no baseline\n".format(size))
+            continue
+        ratio = result['msg_per_sec'] / base['msg_per_sec']
+        regressed = ratio < 1 - tolerance
+        ok = ok and not regressed
+        file.write("{} messages: {:.0f} vs {:.0f} msg/s ({:+.1%}){}\n".format(
+            size, result['msg_per_sec'], base['msg_per_sec'], ratio - 1, ' REGRESSION' if regressed else ''))
+        for name, stats in result['latency_ns'].items():
+            base_stats = base['latency_ns'].get(name)
+            if base_stats and base_stats['p50']:
+                file.write("  {:<9}p50 {}ns vs {}ns ({:+.1%})\n".format(
+                    name, stats['p50'], base_stats['p50'], stats['p50'] / base_stats['p50'] - 1))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the book against seeded synthetic feeds")
+    parser.add_argument('--sizes', help='Comma separated message counts', type=str, default='10000,100000')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-d', '--depth', help='Price levels either side of the mid', type=int, default=50)
+    parser.add_argument('--mix', help='Relative add,cancel,modify,trade rates', type=str, default='0.5,0.3,0.15,0.05')
+    parser.add_argument('--bad-rate', help='Fraction of malformed messages', type=float, default=0.0)
+    parser.add_argument('--distribution', choices=('geometric', 'uniform'), default='geometric')
+    parser.add_argument('--repeat', help='Throughput runs per size, the best one is reported', type=int, default=3)
+    parser.add_argument('--no-memory', help='Skip the traced peak memory pass', action='store_true')
+    parser.add_argument('--save', help='Write the results as json to this file', type=str)
+    parser.add_argument('--baseline', help='Compare against results saved with --save', type=str)
+    parser.add_argument('--tolerance', help='Allowed throughput drop against the baseline', type=float,
+                        default=0.1)
+    args = vars(parser.parse_args())
+
+    add, cancel, modify, trade = [float(rate) for rate in args['mix'].split(',')]
+    results = {}
+    for size in [int(size) for size in args['sizes'].split(',')]:
+        generator = FeedGenerator(seed=args['seed'], depth=args['depth'], add=add, cancel=cancel, modify=modify,
+                                  trade=trade, bad_rate=args['bad_rate'], distribution=args['distribution'])
+        rows = list(generator.messages(size))
+        results[str(size)] = benchmark(rows, memory=not args['no_memory'], repeat=args['repeat'])
+
+    report(results, sys.stdout)
+    if args['save']:
+        with open(args['save'], 'w') as f:
+            json.dump(results, f, indent=2)
+    if args['baseline']:
+        with open(args['baseline']) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args['tolerance'], sys.stdout):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,222 +1,419 @@
-from collections import Iterable
-from heapq import heappop, heappush, heapify
-from typing import Dict, List, IO
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from jump.error import *
 from jump.order import Order
+from jump.sink import NullSink, OutputSink
+from jump.tape import TradeTape
+from jump.tick import TickSize
 from jump.trade import Trade
 
 
+class PriceLevel(object):
+    """
+    FIFO queue of the orders resting at one price.
+
+    The queue is an intrusive doubly linked list: every order carries its own prev/next links and a reference to
+    its level, so an order can be unlinked or moved to the back in O(1) without searching the queue.
+    """
+
+    def __init__(self, price: int):
+        super().__init__()
+        self.price = price
+        self.head: Optional[Order] = None
+        self.tail: Optional[Order] = None
+        self.count = 0
+        # total quantity of the queue, kept up to date as orders join, leave or change size
+        self.quantity = 0
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __iter__(self) -> Iterator[Order]:
+        """Iterate orders from the oldest to the newest."""
+        order = self.head
+        while order is not None:
+            # read the link first so the caller may unlink the order it was handed
+            next_order = order.next
+            yield order
+            order = next_order
+
+    def append(self, order: Order):
+        order.level = self
+        order.prev = self.tail
+        order.next = None
+        if self.tail is None:
+            self.head = order
+        else:
+            self.tail.next = order
+        self.tail = order
+        self.count += 1
+        self.quantity += order.quantity
+
+    def unlink(self, order: Order):
+        if order.prev is None:
+            self.head = order.next
+        else:
+            order.prev.next = order.next
+        if order.next is None:
+            self.tail = order.prev
+        else:
+            order.next.prev = order.prev
+        order.prev = order.next = order.level = None
+        self.count -= 1
+        self.quantity -= order.quantity
+
+    def resize(self, order: Order, quantity: int):
+        """Change the quantity of an order in this queue without touching its place."""
+        self.quantity += quantity - order.quantity
+        order.quantity = quantity
+
+
+class PriceLadder(object):
+    """
+    Price levels for one side of the book, kept in price order.
+
+    Sort keys are stored in a plain list ordered so that the best price is always at the end: bids use the price
+    as the key and asks use the negated price. That gives O(1) access to the best level, O(log n) lookup through
+    bisect, and inserts/deletes that only shift the levels between the touched price and the top of the book,
+    which is where nearly all activity happens.
+    """
+
+    def __init__(self, side: str):
+        super().__init__()
+        self.side = side
+        self.sign = 1 if side == Order.BUY_SIDE else -1
+        self.levels: Dict[int, PriceLevel] = {}
+        self.keys: List[int] = []
+        # prices whose levels changed since the last snapshot, None unless the book tracks deltas
+        self.dirty: Optional[Set[int]] = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def __iter__(self) -> Iterator[PriceLevel]:
+        """Iterate levels from the best price outwards."""
+        levels = self.levels
+        sign = self.sign
+        for key in reversed(self.keys):
+            yield levels[key * sign]
+
+    def best(self) -> Optional[PriceLevel]:
+        return self.levels[self.keys[-1] * self.sign] if self.keys else None
+
+    def best_price(self) -> Optional[int]:
+        return self.keys[-1] * self.sign if self.keys else None
+
+    def get(self, price: int) -> Optional[PriceLevel]:
+        return self.levels.get(price)
+
+    def get_or_create(self, price: int) -> PriceLevel:
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = PriceLevel(price)
+            insort(self.keys, price * self.sign)
+        return level
+
+    def top(self, k: int) -> List[PriceLevel]:
+        """The k best levels, best first."""
+        levels = self.levels
+        sign = self.sign
+        return [levels[key * sign] for key in self.keys[:-k - 1:-1]] if k > 0 else []
+
+    def quantity_through(self, price: int) -> int:
+        """Total quantity resting at price or better, visiting only those levels."""
+        total = 0
+        sign = self.sign
+        for level in self:
+            if (level.price - price) * sign < 0:
+                break
+            total += level.quantity
+        return total
+
+    def mark(self, price: int):
+        if self.dirty is not None:
+            self.dirty.add(price)
+
+    def changes(self) -> List[PriceLevel]:
+        """Levels changed since the last call, highest price first. Levels that were removed come back empty."""
+        levels = self.levels
+        changed = [levels.get(price) or PriceLevel(price) for price in sorted(self.dirty, reverse=True)]
+        self.dirty.clear()
+        return changed
+
+    def remove(self, price: int):
+        del self.levels[price]
+        keys = self.keys
+        key = price * self.sign
+        if keys[-1] == key:
+            keys.pop()
+        else:
+            del keys[bisect_left(keys, key)]
+
+
 class Book(object):
-    def __init__(self, file: IO = None):
+    def __init__(self, sink: OutputSink = None, fill_trades: bool = False, full_snapshot_every: int = 0,
+                 reject_samples: int = 0, tape_capacity: int = 1024, tick_size: TickSize = None):
         super().__init__()
-        self.file = file
-        self.trades: Dict[float, List[Trade]] = {}
+        # prices are whole numbers of ticks everywhere in the book and only become decimals on their way to the sink
+        self.tick_size = tick_size if tick_size is not None else TickSize()
+        self.midpoint = self.tick_size.midpoint
+        self.sink = sink if sink is not None else NullSink()
+        # counts of the messages refused by this book, filled in by whoever feeds it messages
+        self.rejects = Rejects(reject_samples)
+        # decrement matched resting orders on every trade instead of waiting for their cancels
+        self.fill_trades = fill_trades
+        # when set, snapshot() writes only the levels changed since the previous snapshot and a full dump every
+        # full_snapshot_every snapshots, starting with the first
+        self.full_snapshot_every = full_snapshot_every
+        self.snapshot_count = 0
+        # the last tape_capacity trades and the session's volume aggregates
+        self.tape = TradeTape(tape_capacity)
         self.orders: Dict[int, Order] = {}
-        # Keep an index of order ids based on price for fast lookup
-        self.price_index: Dict[str, List[int]] = {}
-        # these lists are used as stacks so we know the best prices at any given time
-        self.best_buy = []
-        self.best_sell = []
+        self.bids = PriceLadder(Order.BUY_SIDE)
+        self.asks = PriceLadder(Order.SELL_SIDE)
+        if full_snapshot_every:
+            self.bids.dirty = set()
+            self.asks.dirty = set()
         self.expected_trade_count = 0
         self.total_quantity = 0
         self.last_trade_price = None
-        self.buy_prices = []
-        self.sell_prices = []
+        # last time-priority sequence number handed out to a queued order
+        self.sequence = 0
+
+    def ladder(self, side: str) -> PriceLadder:
+        return self.bids if side == Order.BUY_SIDE else self.asks
+
+    def best_bid(self) -> Optional[int]:
+        return self.bids.best_price()
+
+    def best_ask(self) -> Optional[int]:
+        return self.asks.best_price()
+
+    def depth(self, side: str, k: int) -> List[Tuple[int, int, int]]:
+        """(price in ticks, quantity, number of orders) of the k best levels of a side, best first."""
+        return [(level.price, level.quantity, level.count) for level in self.ladder(side).top(k)]
+
+    def cumulative_quantity(self, side: str, price: int) -> int:
+        """Quantity resting on a side at price (in ticks) or better."""
+        return self.ladder(side).quantity_through(price)
+
+    def imbalance(self, k: int = 1) -> Optional[float]:
+        """
+        (bid - ask) / (bid + ask) over the quantity of the k best levels of each side, from -1 when only asks rest
+        to 1 when only bids do. None if both sides are empty.
+        """
+        bid = sum(level.quantity for level in self.bids.top(k))
+        ask = sum(level.quantity for level in self.asks.top(k))
+        total = bid + ask
+        return (bid - ask) / total if total else None
 
     def add_order(self, order: Order):
+        code = self.apply_add(order)
+        if code:
+            raise reject_error(code, order_id=order.id)
+
+    def apply_add(self, order: Order) -> Optional[str]:
+        """Add an order, returning the reject code instead of raising when it is refused."""
         if not order.validate():
-            raise InvalidOrderError('Invalid order, missing or invalid data', order_id=order.id)
+            return INVALID_ORDER
         elif order.id in self.orders:
-            raise DuplicateOrderError('Duplicate order', order_id=order.id)
+            return DUPLICATE_ORDER
 
         self.orders[order.id] = order
-        key = self.price_index_key(order.price, order.side)
-        self.price_index[key] = self.price_index[key] if key in self.price_index else []
-        self.price_index[key].append(order.id)
-        self.update_best(order)
-        self.add_price(order)
-
-    def add_price(self, order):
-        if order.side == Order.BUY_SIDE and order.price not in self.buy_prices:
-            heappush(self.buy_prices, order.price)
-        if order.side == Order.SELL_SIDE and order.price not in self.sell_prices:
-            heappush(self.sell_prices, order.price)
-
-    def add_price_old(self, order):
-        if order.side == Order.BUY_SIDE and order.price not in self.buy_prices:
-            self.buy_prices.append(order.price)
-            self.buy_prices = sorted(self.buy_prices, reverse=True)
-        if order.side == Order.SELL_SIDE and order.price not in self.sell_prices:
-            self.sell_prices.append(order.price)
-            self.sell_prices = sorted(self.sell_prices)
+        self.enqueue(order, self.ladder(order.side).get_or_create(order.price))
+        self.check_crossed()
+        return None
 
     def remove_order(self, order: Order):
-        if not order.validate():
-            raise InvalidOrderError('Invalid order, missing or invalid data', order_id=order.id)
-
-        existing_order = self.orders[order.id] if order.id in self.orders else None
+        code = self.apply_remove(order.id, order.side, order.quantity, order.price)
+        if code:
+            raise reject_error(code, order_id=order.id)
+
+    def apply_remove(self, order_id: int, side: str, quantity: int, price: int) -> Optional[str]:
+        """
+        Cancel quantity from a resting order straight from message fields, without building an Order. Returns the
+        reject code when the cancel is refused.
+        """
+        if not Order.is_valid(order_id, side, price, quantity):
+            return INVALID_ORDER
+
+        existing_order = self.orders.get(order_id)
         if not existing_order:
-            raise OrderDoesNotExistError('Order does not exist', order_id=order.id)
-
-        self.add_price(order)
+            return ORDER_DOES_NOT_EXIST
 
-        if existing_order.quantity >= order.quantity:
-            existing_order.quantity -= order.quantity
+        if existing_order.quantity >= quantity:
+            existing_order.level.resize(existing_order, existing_order.quantity - quantity)
+            self.ladder(existing_order.side).mark(existing_order.price)
             # delete the order if quantity goes down to 0
             if not existing_order.quantity:
-                del self.orders[order.id]
-                self.price_index[self.price_index_key(order.price, order.side)].remove(order.id)
-                if not self.price_index[self.price_index_key(order.price, order.side)]:
-                    # remove from index if list is empty
-                    del self.price_index[self.price_index_key(order.price, order.side)]
-                    # check to see the order we are removing has the best buy/sell
-                    self.remove_price(order)
-                self.update_best(order)
-
-    def remove_price(self, order):
-        a = []
-        heap = self.buy_prices if order.side == Order.BUY_SIDE else self.sell_prices
-
-        a.append(heappop(heap))
-        while self.peek(a) != order.price:
-            a.append(heappop(heap))
-
-        for x in a:
-            if x != order.price:
-                heappush(heap, x)
-
-    def remove_price_old(self, order):
-        if order.side == Order.BUY_SIDE:
-            self.buy_prices.remove(order.price)
-        elif order.side == Order.SELL_SIDE:
-            self.sell_prices.remove(order.price)
+                del self.orders[order_id]
+                self.unlink(existing_order)
+                self.check_crossed()
+        return None
 
     def modify_order(self, order: Order):
-        if not order.validate():
-            raise InvalidOrderError('Invalid order, missing or invalid data', order_id=order.id)
+        code = self.apply_modify(order.id, order.side, order.quantity, order.price)
+        if code:
+            raise reject_error(code, order_id=order.id)
 
-        self.add_price(order)
+    def apply_modify(self, order_id: int, side: str, quantity: int, price: int) -> Optional[str]:
+        """
+        Change the price and/or quantity of a resting order, returning the reject code when the change is refused.
 
-        existing_order = self.orders[order.id] if order.id in self.orders else None
+        A quantity decrease keeps the order's place in its queue. A quantity increase or a price change sends it to
+        the back of the queue at its (new) price.
+        """
+        if not Order.is_valid(order_id, side, price, quantity):
+            return INVALID_ORDER
+
+        existing_order = self.orders.get(order_id)
         if existing_order:
-            existing_order.quantity = order.quantity
-            self.update_best(order)
+            if existing_order.price != price:
+                self.unlink(existing_order)
+                existing_order.price = price
+                self.enqueue(existing_order, self.ladder(existing_order.side).get_or_create(price))
+            elif quantity > existing_order.quantity:
+                level = existing_order.level
+                level.unlink(existing_order)
+                self.enqueue(existing_order, level)
+            existing_order.level.resize(existing_order, quantity)
+            self.ladder(existing_order.side).mark(price)
+            self.check_crossed()
+        return None
+
+    def enqueue(self, order: Order, level: PriceLevel):
+        self.sequence += 1
+        order.sequence = self.sequence
+        level.append(order)
+        self.ladder(order.side).mark(level.price)
+
+    def unlink(self, order: Order):
+        level = order.level
+        level.unlink(order)
+        ladder = self.ladder(order.side)
+        ladder.mark(level.price)
+        if not level:
+            # drop the level once its last order is gone
+            ladder.remove(level.price)
 
     def add_trade(self, trade: Trade):
-        self.match(trade)
-        self.trades[trade.price] = self.trades[trade.price] if trade.price in self.trades else []
-        self.trades[trade.price].append(trade)
+        code = self.apply_trade(trade)
+        if code:
+            raise reject_error(code, price=trade.price, quantity=trade.quantity)
+
+    def apply_trade(self, trade: Trade) -> Optional[str]:
+        """Record a trade, returning the reject code when it cannot be matched against the book."""
+        if trade.price is None:
+            # the price field was not a finite number of ticks
+            return INVALID_ORDER
+        matched_orders = self.find_matches(trade)
+        if matched_orders is None:
+            return TRADE_NOT_MATCHED
+        if self.fill_trades:
+            self.fill(matched_orders, trade.quantity)
+
+        self.tape.record(trade)
         if trade.price != self.last_trade_price:
             self.last_trade_price = trade.price
             self.total_quantity = 0
         self.total_quantity += trade.quantity
-        if self.file:
-            self.file.write("{}@{}\n".format(self.total_quantity, self.last_trade_price))
+        self.sink.trade(self.total_quantity, self.tick_size.to_price(self.last_trade_price))
+        return None
 
     def match(self, trade: Trade) -> List[Order]:
-        # use list comprehension to get order ids for possible sell matches and flatten the list of lists
-        possible_matches = self.flatten([self.price_index[o] for o in self.price_index if
-                                         o.endswith('-{}'.format(Order.SELL_SIDE)) and float(
-                                             o.split('-')[0]) <= trade.price])
-        # pull matching order objects and sort them by order_datetime ascending
-        matched_orders = sorted([self.orders[o] for o in possible_matches], key=lambda order: order.order_datetime)
-        if not matched_orders:
-            raise TradeNotMatchedError('Cannot match trade with order(s)', price=trade.price, quantity=trade.quantity)
-
-        # make sure we can fill the order
-        quantity_left = sum([order.quantity for order in matched_orders])
-        if trade.quantity > quantity_left:
-            raise TradeNotMatchedError('Not enough to match trade with order(s)', price=trade.price,
-                                       quantity=trade.quantity)
+        matched_orders = self.find_matches(trade)
+        if matched_orders is None:
+            raise reject_error(TRADE_NOT_MATCHED, price=trade.price, quantity=trade.quantity)
+        if self.fill_trades:
+            self.fill(matched_orders, trade.quantity)
         return matched_orders
 
-    def output_state(self, file: IO):
-        def out(header, side):
-            file.write("{}:\n".format(header))
-            data = [o for o in self.price_index if o.endswith('-{}'.format(side))]
-            for key in data:
-                price = float(key.split('-')[0])
-                orders = ""
-                for order_id in self.price_index[self.price_index_key(price, side)]:
-                    quantity = self.orders[order_id].quantity
-                    orders += "{},".format(str(quantity))
-
-                file.write("{},{}\n".format('{0:.2f}'.format(price), orders[:-1]))
-
-        out("SELLS", Order.SELL_SIDE)
-        out("BUYS", Order.BUY_SIDE)
-
-    def midquote(self, file: IO):
-        if self.buy_prices and self.sell_prices:
-            bb = max(self.buy_prices)
-            bs = min(self.sell_prices)
-            mid = (bb + bs) / 2
-            file.write('{:.2f}\n'.format(mid))
-        else:
-            file.write('NaN\n')
-
-    def midquote_old2(self, file: IO):
-        if self.buy_prices and self.sell_prices:
-            mid = (self.buy_prices[0] + self.sell_prices[0]) / 2
-            file.write('{:.2f}\n'.format(mid))
-        else:
-            file.write('NaN\n')
-
-    def midquote_old(self, file: IO):
-        if self.best_buy and self.best_sell:
-            buy = self.peek(self.best_buy)
-            sell = self.peek(self.best_sell)
-            mid = (buy + sell) / 2
-            # self.best_buy.append(buy)
-            # self.best_sell.append(sell)
-            file.write('{0:.2f}\n'.format(mid))
-        else:
-            file.write('NaN\n')
+    def find_matches(self, trade: Trade) -> Optional[List[Order]]:
+        """
+        Match a trade against resting sell orders in price-time priority, None if they cannot cover it.
+
+        Levels are walked from the best ask outwards and each level's queue from the oldest order, stopping as soon
+        as the trade quantity is covered. When the book was created with fill_trades the caller decrements the
+        matched orders, removing them once they are fully filled.
+        """
+        matched_orders = []
+        quantity_left = trade.quantity
+        for level in self.asks:
+            if level.price > trade.price or quantity_left <= 0:
+                break
+            for order in level:
+                matched_orders.append(order)
+                quantity_left -= order.quantity
+                if quantity_left <= 0:
+                    break
+
+        if not matched_orders or quantity_left > 0:
+            return None
+        return matched_orders
 
-    def update_best_old(self, order: Order):
-        if order.side == Order.BUY_SIDE:
-            if not self.best_buy_price or order.price > self.best_buy_price:
-                self.best_buy_price = order.price
-        else:
-            if not self.best_sell_price or order.price < self.best_sell_price:
-                self.best_sell_price = order.price
-
-    def update_best(self, order: Order):
-        if order.side == Order.BUY_SIDE:
-            if not self.best_buy or order.price > self.peek(self.best_buy):
-                self.best_buy.append(order.price)
-            elif order.action == Order.ACTION_REMOVE and order.price == self.peek(self.best_buy):
-                self.best_buy.pop()
+    def fill(self, matched_orders: List[Order], quantity: int):
+        for order in matched_orders:
+            filled = min(order.quantity, quantity)
+            order.level.resize(order, order.quantity - filled)
+            quantity -= filled
+            self.asks.mark(order.price)
+            if not order.quantity:
+                del self.orders[order.id]
+                self.unlink(order)
+        self.check_crossed()
+
+    def output_state(self):
+        # both sides are printed from the highest price down
+        self.sink.state(self.dump_levels(reversed(list(self.asks))), self.dump_levels(self.bids))
+        if self.full_snapshot_every:
+            self.asks.dirty.clear()
+            self.bids.dirty.clear()
+
+    def output_delta(self):
+        self.sink.delta(self.dump_levels(self.asks.changes()), self.dump_levels(self.bids.changes()))
+
+    def dump_levels(self, levels: Iterable[PriceLevel]) -> Iterator[Tuple[float, List[int]]]:
+        """
+        (decimal price, quantity of each order in queue order) for each level, produced as the sink reads them so
+        a sink that drops dumps pays nothing for them.
+        """
+        to_price = self.tick_size.to_price
+        for level in levels:
+            yield to_price(level.price), [order.quantity for order in level]
+
+    def snapshot(self):
+        """Write a periodic book dump, either the full state or a delta when the book tracks changed levels."""
+        if self.full_snapshot_every and self.snapshot_count % self.full_snapshot_every:
+            self.output_delta()
         else:
-            if not self.best_sell or order.price < self.peek(self.best_sell):
-                self.best_sell.append(order.price)
-            elif order.action == Order.ACTION_REMOVE and order.price < self.peek(self.best_sell):
-                self.best_sell.pop()
-
-        bs = self.peek(self.best_sell)
-        bb = self.peek(self.best_buy)
-        if bs and bb and bs <= bb:
+            self.output_state()
+        self.snapshot_count += 1
+
+    def midquote(self):
+        bb = self.bids.best_price()
+        bs = self.asks.best_price()
+        self.sink.midquote(self.midpoint(bb, bs) if bb is not None and bs is not None else None)
+
+    def check_crossed(self):
+        bs = self.asks.best_price()
+        bb = self.bids.best_price()
+        if bs is not None and bb is not None and bs <= bb:
             self.expected_trade_count += 1
 
     def expected_trades(self):
-        if self.expected_trade_count and not self.trades:
+        if self.expected_trade_count and not self.tape:
             raise BestPriceButNoTradeError(
                 'Expected at least {} trade(s), but got none'.format(self.expected_trade_count))
         return True
 
-    @staticmethod
-    def peek(l):
-        return l[len(l) - 1] if l else None
-
-    @staticmethod
-    def price_index_key(price, side):
-        return "{}-{}".format(price, side)
-
-    @staticmethod
-    def flatten(l):
-        for el in l:
-            if isinstance(el, Iterable) and not isinstance(el, (str, bytes)):
-                yield from Book.flatten(el)
-            else:
-                yield el
+    def check_expected_trades(self):
+        """End of feed check, counts a reject if the book crossed but never traded."""
+        if self.expected_trade_count and not self.tape:
+            self.rejects.record(BEST_PRICE_BUT_NO_TRADE)
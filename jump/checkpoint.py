@@ -0,0 +1,165 @@
+import os
+import struct
+from typing import IO, Optional
+
+from jump.book import Book
+from jump.error import ERROR_CODES
+from jump.order import Order
+from jump.tape import PriceVolume
+from jump.trade import Trade
+
+MAGIC = b'JMPC'
+VERSION = 3
+
+# magic, version, tick size numerator and denominator, input offset, output offset, messages replayed, sequence,
+# expected trade count, snapshot count, total traded quantity, last trade price (0 before the first trade), then
+# the reject counts in ERROR_CODES order. Prices are in ticks throughout.
+HEADER = struct.Struct('<4sHqqqqqqqqqq' + 'q' * len(ERROR_CODES))
+COUNT = struct.Struct('<q')
+# id, side, price, quantity, sequence
+ORDER = struct.Struct('<qcqqq')
+# trades, volume and notional of the session
+SESSION = struct.Struct('<qqq')
+# price, volume, trades at that price
+PRICE_VOLUME = struct.Struct('<qqq')
+# price, quantity of a trade on the tape
+TRADE = struct.Struct('<qq')
+PRICE = struct.Struct('<q')
+
+
+class CheckpointError(Exception):
+    pass
+
+
+class Checkpoint(object):
+    """Where a replay stood when its book was saved: the byte offsets to carry on from and the messages replayed."""
+
+    def __init__(self, input_offset: int, output_offset: int = -1, messages: int = 0):
+        super().__init__()
+        self.input_offset = input_offset
+        # -1 when the output was not a seekable file
+        self.output_offset = output_offset
+        self.messages = messages
+
+
+def write_checkpoint(path: str, book: Book, checkpoint: Checkpoint):
+    """
+    Save the book to path, atomically: the file is written next to it and renamed over the previous checkpoint.
+
+    Orders are written side by side, best level first and in queue order within a level, so loading them back in
+    the same order rebuilds every queue with its time priority.
+    """
+    last_trade_price = book.last_trade_price if book.last_trade_price is not None else 0
+    parts = [HEADER.pack(MAGIC, VERSION, book.tick_size.numerator, book.tick_size.denominator,
+                         checkpoint.input_offset, checkpoint.output_offset, checkpoint.messages, book.sequence,
+                         book.expected_trade_count, book.snapshot_count, book.total_quantity, last_trade_price,
+                         *(book.rejects.counts[code] for code in ERROR_CODES)),
+             COUNT.pack(len(book.orders))]
+    pack_order = ORDER.pack
+    for ladder in (book.bids, book.asks):
+        for level in ladder:
+            for order in level:
+                parts.append(pack_order(order.id, order.side.encode(), order.price, order.quantity, order.sequence))
+
+    tape = book.tape
+    parts.append(SESSION.pack(tape.count, tape.volume, tape.notional))
+    parts.append(COUNT.pack(len(tape.prices)))
+    parts.extend(PRICE_VOLUME.pack(price, at_price.volume, at_price.count) for price, at_price in tape.prices.items())
+    parts.append(COUNT.pack(len(tape)))
+    parts.extend(TRADE.pack(trade.price, trade.quantity) for trade in tape)
+
+    # levels changed since the last delta dump, so the first delta after a resume is the same as without one
+    for ladder in (book.bids, book.asks):
+        dirty = ladder.dirty or ()
+        parts.append(COUNT.pack(len(dirty)))
+        parts.extend(PRICE.pack(price) for price in sorted(dirty))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b''.join(parts))
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path: str, book: Book) -> Checkpoint:
+    """Load a checkpoint into an empty book and return where its replay stood."""
+    if book.orders or book.tape:
+        raise CheckpointError('Checkpoints can only be loaded into an empty book')
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise CheckpointError('Truncated checkpoint: {}'.format(path))
+    header = HEADER.unpack_from(data)
+    magic, version, numerator, denominator, input_offset, output_offset, messages = header[:7]
+    if magic != MAGIC or version != VERSION:
+        raise CheckpointError('Not a version {} checkpoint: {}'.format(VERSION, path))
+    if (numerator, denominator) != (book.tick_size.numerator, book.tick_size.denominator):
+        raise CheckpointError('Checkpoint {} was taken with a tick size of {}/{}, not {}'.format(
+            path, numerator, denominator, book.tick_size))
+    (book.sequence, book.expected_trade_count, book.snapshot_count, book.total_quantity,
+     last_trade_price) = header[7:12]
+    book.last_trade_price = last_trade_price or None
+    book.rejects.counts.update(zip(ERROR_CODES, header[12:]))
+
+    try:
+        pos = HEADER.size
+        count, = COUNT.unpack_from(data, pos)
+        pos += COUNT.size
+        orders = book.orders
+        for order_id, side, price, quantity, sequence in ORDER.iter_unpack(data[pos:pos + count * ORDER.size]):
+            order = Order(id=order_id, side=side.decode(), price=price, quantity=quantity, action=Order.ACTION_ADD)
+            order.sequence = sequence
+            orders[order_id] = order
+            book.ladder(order.side).get_or_create(price).append(order)
+        pos += count * ORDER.size
+
+        tape = book.tape
+        tape.count, tape.volume, tape.notional = SESSION.unpack_from(data, pos)
+        pos += SESSION.size
+        count, = COUNT.unpack_from(data, pos)
+        pos += COUNT.size
+        for price, volume, trade_count in PRICE_VOLUME.iter_unpack(data[pos:pos + count * PRICE_VOLUME.size]):
+            at_price = tape.prices[price] = PriceVolume(price)
+            at_price.volume = volume
+            at_price.count = trade_count
+        pos += count * PRICE_VOLUME.size
+        count, = COUNT.unpack_from(data, pos)
+        pos += COUNT.size
+        # a tape smaller than the saved one keeps the newest trades
+        tape.recent.extend(Trade(quantity=quantity, price=price) for price, quantity in
+                           TRADE.iter_unpack(data[pos:pos + count * TRADE.size]))
+        pos += count * TRADE.size
+
+        for ladder in (book.bids, book.asks):
+            count, = COUNT.unpack_from(data, pos)
+            pos += COUNT.size
+            prices = [price for price, in PRICE.iter_unpack(data[pos:pos + count * PRICE.size])]
+            pos += count * PRICE.size
+            if ladder.dirty is not None:
+                ladder.dirty.update(prices)
+    except struct.error:
+        raise CheckpointError('Truncated checkpoint: {}'.format(path))
+    return Checkpoint(input_offset, output_offset, messages)
+
+
+class Checkpointer(object):
+    """
+    Saves the book every `every` messages of a replay.
+
+    position is the feed's FeedPosition, output the file the sink writes to if its offset should be saved too, so
+    a resumed run can cut the output back to exactly where the checkpoint was taken.
+    """
+
+    def __init__(self, path: str, every: int, position, output: Optional[IO] = None):
+        super().__init__()
+        self.path = path
+        self.every = every
+        self.position = position
+        self.output = output
+
+    def save(self, book: Book, messages: int):
+        output_offset = -1
+        if self.output is not None:
+            # everything up to this message has to be on disk before its offset means anything
+            book.sink.flush()
+            output_offset = self.output.tell()
+        write_checkpoint(self.path, book, Checkpoint(self.position.offset, output_offset, messages))
@@ -1,3 +1,6 @@
+from collections import deque
+
+
 class DuplicateOrderError(Exception):
     def __init__(self, *args, order_id=None):
         super().__init__(*args)
@@ -29,3 +32,55 @@ class BestPriceButNoTradeError(Exception):
 
 class InvalidMessageError(Exception):
     pass
+
+
+# reject codes, in the order the ERRORS summary lists them
+INVALID_MESSAGE = 'a'
+DUPLICATE_ORDER = 'b'
+TRADE_NOT_MATCHED = 'c'
+ORDER_DOES_NOT_EXIST = 'd'
+BEST_PRICE_BUT_NO_TRADE = 'e'
+INVALID_ORDER = 'f'
+ERROR_CODES = (INVALID_MESSAGE, DUPLICATE_ORDER, TRADE_NOT_MATCHED, ORDER_DOES_NOT_EXIST, BEST_PRICE_BUT_NO_TRADE,
+               INVALID_ORDER)
+
+# the exception type and message the raising APIs use for each reject code
+REJECT_ERRORS = {
+    INVALID_MESSAGE: (InvalidMessageError, 'Invalid message'),
+    DUPLICATE_ORDER: (DuplicateOrderError, 'Duplicate order'),
+    TRADE_NOT_MATCHED: (TradeNotMatchedError, 'Cannot match trade with order(s)'),
+    ORDER_DOES_NOT_EXIST: (OrderDoesNotExistError, 'Order does not exist'),
+    BEST_PRICE_BUT_NO_TRADE: (BestPriceButNoTradeError, 'Expected at least one trade, but got none'),
+    INVALID_ORDER: (InvalidOrderError, 'Invalid order, missing or invalid data'),
+}
+
+
+def reject_error(code: str, **details) -> Exception:
+    error_type, message = REJECT_ERRORS[code]
+    return error_type(message, **details)
+
+
+class Rejects(object):
+    """
+    Running count of rejected messages per reject code.
+
+    Rejects are counted as they happen instead of keeping an exception object per bad message. With a sample_size
+    the most recent offending messages are kept as well, the oldest dropping out first.
+    """
+
+    def __init__(self, sample_size: int = 0):
+        super().__init__()
+        self.counts = dict.fromkeys(ERROR_CODES, 0)
+        self.samples = deque(maxlen=sample_size) if sample_size else None
+
+    def record(self, code: str, message=None):
+        self.counts[code] += 1
+        if self.samples is not None:
+            self.samples.append((code, message))
+
+    def merge(self, counts: dict):
+        for code, count in counts.items():
+            self.counts[code] += count
+
+    def total(self) -> int:
+        return sum(self.counts.values())
@@ -0,0 +1,138 @@
+from typing import Iterable, Iterator, List, Optional
+
+from jump.book import Book
+from jump.error import *
+from jump.feed_processor import MessageDispatcher
+
+
+class Event(object):
+    """
+    Something a message did to the book. message is the index of that message in the input, counting from 0.
+
+    Prices are in ticks, like everywhere in the book; Book.tick_size.to_price turns them into decimals.
+    """
+
+    __slots__ = ('message',)
+
+    def __init__(self, message: int):
+        self.message = message
+
+    def fields(self) -> tuple:
+        return tuple(getattr(self, name) for cls in type(self).__mro__[-2::-1] for name in cls.__dict__['__slots__'])
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.fields() == other.fields()
+
+    def __repr__(self):
+        return '{}{}'.format(type(self).__name__, self.fields())
+
+
+class Midquote(Event):
+    """The midquote moved. bid and ask are the best prices, either is None when its side is empty."""
+
+    __slots__ = ('bid', 'ask')
+
+    def __init__(self, message: int, bid: Optional[int], ask: Optional[int]):
+        super().__init__(message)
+        self.bid = bid
+        self.ask = ask
+
+    @property
+    def mid(self) -> Optional[float]:
+        """The midquote in ticks, None unless both sides have orders."""
+        return (self.bid + self.ask) / 2 if self.bid is not None and self.ask is not None else None
+
+
+class TradePrint(Event):
+    """A trade matched the book. total_quantity is the running quantity traded at this price, as printed by the CLI."""
+
+    __slots__ = ('price', 'quantity', 'total_quantity')
+
+    def __init__(self, message: int, price: int, quantity: int, total_quantity: int):
+        super().__init__(message)
+        self.price = price
+        self.quantity = quantity
+        self.total_quantity = total_quantity
+
+
+class Reject(Event):
+    """
+    The message was refused with one of the reject codes of jump.error. row is the message, or None for the end of
+    feed check, which is reported with message set to the number of messages.
+    """
+
+    __slots__ = ('code', 'row')
+
+    def __init__(self, message: int, code: str, row: Optional[List[str]]):
+        super().__init__(message)
+        self.code = code
+        self.row = row
+
+
+class LevelUpdate(Event):
+    """A price level changed. quantity and orders are what now rests there, both 0 once the level is gone."""
+
+    __slots__ = ('side', 'price', 'quantity', 'orders')
+
+    def __init__(self, message: int, side: str, price: int, quantity: int, orders: int):
+        super().__init__(message)
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.orders = orders
+
+
+def book_events(messages: Iterable[List[str]], book: Optional[Book] = None, levels: bool = True) -> Iterator[Event]:
+    """
+    Apply feed messages to a book and yield what each one changed, for using the book in-process.
+
+    messages are rows of fields as csv.reader produces them. After each message come its Reject, its TradePrint,
+    a LevelUpdate per level it touched (asks and bids, highest price first) and a Midquote if the midquote moved,
+    in that order. Nothing is formatted and nothing is written, the book's own output is not used: pass a book
+    with the default NullSink. An event object is only created when there is something to report.
+
+    Level updates come from the book's changed-level tracking, which this turns on: a book that also writes delta
+    dumps should not be passed in. levels=False leaves them out.
+    """
+    if book is None:
+        book = Book()
+    dispatch = MessageDispatcher(book).dispatch
+    bids, asks = book.bids, book.asks
+    tape = book.tape
+    if levels:
+        for ladder in (asks, bids):
+            if ladder.dirty is None:
+                ladder.dirty = set()
+            ladder.dirty.clear()
+    bb, ba = bids.best_price(), asks.best_price()
+    last_mid = bb + ba if bb is not None and ba is not None else None
+    trades = tape.count
+    volume = tape.volume
+    index = -1
+    for index, row in enumerate(messages):
+        code = dispatch(row)
+        if code:
+            yield Reject(index, code, row)
+        if tape.count != trades:
+            trades = tape.count
+            yield TradePrint(index, book.last_trade_price, tape.volume - volume, book.total_quantity)
+            volume = tape.volume
+        if levels:
+            for ladder in (asks, bids):
+                dirty = ladder.dirty
+                if dirty:
+                    get = ladder.levels.get
+                    for price in sorted(dirty, reverse=True):
+                        level = get(price)
+                        yield LevelUpdate(index, ladder.side, price, level.quantity if level is not None else 0,
+                                          level.count if level is not None else 0)
+                    dirty.clear()
+        bb, ba = bids.best_price(), asks.best_price()
+        mid = bb + ba if bb is not None and ba is not None else None
+        if mid != last_mid:
+            last_mid = mid
+            yield Midquote(index, bb, ba)
+    expected = book.rejects.counts[BEST_PRICE_BUT_NO_TRADE]
+    book.check_expected_trades()
+    if book.rejects.counts[BEST_PRICE_BUT_NO_TRADE] != expected:
+        yield Reject(index + 1, BEST_PRICE_BUT_NO_TRADE, None)
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 
 from jump.book import Book
-from jump.error import InvalidMessageError
+from jump.error import INVALID_MESSAGE, InvalidMessageError
 from jump.order import Order
 from jump.trade import Trade
 
@@ -9,47 +10,50 @@ from jump.trade import Trade
 class MessageProcessor(ABC):
 
     @abstractmethod
-    def process(self, row):
+    def process(self, row) -> Optional[str]:
+        """Apply the row to the book, returning the reject code if the book refused it."""
         ...
 
 
 class AddProcessor(MessageProcessor):
     def __init__(self, book: Book = None):
         self.book = book
+        self.to_ticks = book.tick_size.to_ticks if book is not None else None
 
     def process(self, message):
-        order = Order(id=int(message[1]), side=message[2], quantity=int(message[3]), price=float(message[4]),
-                      action=message[0])
-        self.book.add_order(order)
+        order = Order(id=int(message[1]), side=message[2], quantity=int(message[3]),
+                      price=self.to_ticks(message[4]), action=message[0])
+        return self.book.apply_add(order)
 
 
 class RemoveProcessor(MessageProcessor):
     def __init__(self, book: Book = None):
         self.book = book
+        self.to_ticks = book.tick_size.to_ticks if book is not None else None
 
     def process(self, message):
-        order = Order(id=int(message[1]), side=message[2], quantity=int(message[3]), price=float(message[4]),
-                      action=message[0])
-        self.book.remove_order(order)
+        return self.book.apply_remove(int(message[1]), message[2], int(message[3]),
+                                      self.to_ticks(message[4]))
 
 
 class ModifyProcessor(MessageProcessor):
     def __init__(self, book: Book = None):
         self.book = book
+        self.to_ticks = book.tick_size.to_ticks if book is not None else None
 
     def process(self, message):
-        order = Order(id=int(message[1]), side=message[2], quantity=int(message[3]), price=float(message[4]),
-                      action=message[0])
-        self.book.modify_order(order)
+        return self.book.apply_modify(int(message[1]), message[2], int(message[3]),
+                                      self.to_ticks(message[4]))
 
 
 class TradeProcessor(MessageProcessor):
     def __init__(self, book: Book = None):
         self.book = book
+        self.to_ticks = book.tick_size.to_ticks if book is not None else None
 
     def process(self, message):
-        trade = Trade(quantity=int(message[1]), price=float(message[2]))
-        self.book.add_trade(trade)
+        trade = Trade(quantity=int(message[1]), price=self.to_ticks(message[2]))
+        return self.book.apply_trade(trade)
 
 
 class ProcessorFactory(object):
@@ -67,3 +71,35 @@ class ProcessorFactory(object):
             return TradeProcessor(book=book)
 
         raise InvalidMessageError('Invalid message: {}'.format(message))
+
+
+class MessageDispatcher(object):
+    """
+    Routes feed rows to processors bound to a single book.
+
+    The processors are created once, so dispatching a row is a dict lookup and a call rather than a new processor
+    object per message like ProcessorFactory. Refused rows are counted in the book's rejects rather than raised.
+    """
+
+    def __init__(self, book: Book):
+        super().__init__()
+        self.book = book
+        self.rejects = book.rejects
+        # action -> (expected row length, bound process method)
+        self.table = {
+            Order.ACTION_ADD: (5, AddProcessor(book=book).process),
+            Order.ACTION_REMOVE: (5, RemoveProcessor(book=book).process),
+            Order.ACTION_MODIFY: (5, ModifyProcessor(book=book).process),
+            'T': (3, TradeProcessor(book=book).process),
+        }
+
+    def dispatch(self, message) -> Optional[str]:
+        """Apply a row to the book, returning its reject code or None."""
+        entry = self.table.get(message[0]) if message else None
+        if entry is None or len(message) != entry[0]:
+            code = INVALID_MESSAGE
+        else:
+            code = entry[1](message)
+        if code:
+            self.rejects.record(code, message)
+        return code
@@ -0,0 +1,136 @@
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import queue
+import threading
+from typing import IO, Iterator, Optional
+
+from jump.book import Book
+from jump.feed_processor import MessageDispatcher
+
+# magic bytes of the compressed formats open_feed recognises, and the function that opens each
+COMPRESSION = ((b'\x1f\x8b', gzip.open), (b'BZh', bz2.open), (b'\xfd7zXZ\x00', lzma.open))
+# decompressed bytes per chunk, and chunks decompressed ahead of the reader
+CHUNK_SIZE = 1 << 20
+READ_AHEAD = 8
+
+
+class FeedPosition(object):
+    """Byte offset of the next record a feed will read, kept up to date by the feed for checkpoints."""
+
+    __slots__ = ('offset',)
+
+    def __init__(self, offset: int = 0):
+        self.offset = offset
+
+
+class ByteLines(object):
+    """
+    Decoded lines of a binary file, counting the bytes consumed into a FeedPosition.
+
+    csv.reader pulls one line per row, so after each row the position is the offset of the next one, which a text
+    file cannot report while it is being iterated.
+    """
+
+    def __init__(self, file: IO, position: FeedPosition):
+        super().__init__()
+        self.lines = iter(file)
+        self.position = position
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = next(self.lines)
+        self.position.offset += len(line)
+        return line.decode()
+
+
+class ReadAhead(io.RawIOBase):
+    """
+    Reads a file ahead of its consumer in a background thread, read_ahead chunks of chunk_size bytes at most.
+
+    Meant for decompressing: the thread spends most of its time in zlib, bz2 or lzma, which release the GIL while
+    they work, so a feed is decompressed while the book is being updated from the chunks before it.
+    """
+
+    def __init__(self, file: IO, chunk_size: int = CHUNK_SIZE, read_ahead: int = READ_AHEAD):
+        super().__init__()
+        self.file = file
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(maxsize=read_ahead)
+        self.chunk = memoryview(b'')
+        self.stopped = False
+        self.thread = threading.Thread(target=self.read_ahead, daemon=True)
+        self.thread.start()
+
+    def read_ahead(self):
+        try:
+            while not self.stopped:
+                chunk = self.file.read(self.chunk_size)
+                self.chunks.put(chunk)
+                if not chunk:
+                    break
+        except BaseException as e:
+            self.chunks.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self.chunk:
+            chunk = self.chunks.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            if not chunk:
+                # leave the end of file marker for any later read
+                self.chunks.put(chunk)
+                return 0
+            self.chunk = memoryview(chunk)
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped = True
+            # unblock the thread if it is waiting for room in the queue
+            while self.thread.is_alive():
+                try:
+                    self.chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.file.close()
+        super().close()
+
+
+def compression(path: str):
+    """The function opening path if it is a compressed file open_feed recognises, else None."""
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    for prefix, opener in COMPRESSION:
+        if magic.startswith(prefix):
+            return opener
+    return None
+
+
+def open_feed(path: str, binary: bool = False) -> IO:
+    """
+    Open a feed file for reading, in text mode like open() unless binary. gzip, bz2 and xz files are recognised by
+    their first bytes and decompressed as they are read, in a ReadAhead thread.
+    """
+    opener = compression(path)
+    if opener is None:
+        return open(path, 'rb' if binary else 'r')
+    stream = io.BufferedReader(ReadAhead(opener(path, 'rb')), buffer_size=CHUNK_SIZE)
+    return stream if binary else io.TextIOWrapper(stream)
+
+
+def csv_feed(file: IO, book: Book) -> Iterator[Optional[str]]:
+    """Apply each csv row of the file to the book, yielding the row's reject code or None."""
+    dispatch = MessageDispatcher(book).dispatch
+    for message in csv.reader(file):
+        yield dispatch(message)
@@ -0,0 +1,144 @@
+import argparse
+import csv
+import random
+import sys
+from typing import Dict, Iterator, List
+
+from jump.order import Order
+
+
+class FeedGenerator(object):
+    """
+    Seeded generator of synthetic feeds in the exchange csv format.
+
+    Orders are placed around a mid price that random-walks by one tick now and then, at a distance from the mid of
+    1 to depth ticks drawn from the chosen price distribution: 'geometric' crowds orders near the touch like a real
+    book, 'uniform' spreads them evenly over the depth. Cancels and modifies pick a random resting order and trades
+    print at the best ask for no more than what rests there, so a clean feed replays without errors. A bad_rate
+    fraction of the rows are replaced with malformed messages or cancels of unknown orders.
+
+    The same seed and parameters always produce the same feed.
+    """
+
+    BAD_MESSAGES = ('BADMESSAGE', 'A,1,B', 'T,1', 'Q,1,B,1,1')
+
+    def __init__(self, seed: int = 0, depth: int = 50, mid: int = 1000, tick: int = 1, add: float = 0.5,
+                 cancel: float = 0.3, modify: float = 0.15, trade: float = 0.05, bad_rate: float = 0.0,
+                 distribution: str = 'geometric', max_quantity: int = 100):
+        super().__init__()
+        if distribution not in ('geometric', 'uniform'):
+            raise ValueError('Unknown price distribution: {}'.format(distribution))
+        self.random = random.Random(seed)
+        self.depth = depth
+        self.mid = mid
+        self.tick = tick
+        total = add + cancel + modify + trade
+        # cumulative thresholds for picking the message type
+        self.thresholds = (add / total, (add + cancel) / total, (add + cancel + modify) / total)
+        self.bad_rate = bad_rate
+        self.distribution = distribution
+        self.max_quantity = max_quantity
+        self.next_id = 1
+        # resting orders as [id, side, quantity, price], kept in a list so a random one can be removed in O(1)
+        self.live: List[List] = []
+        # total resting sell quantity per price, to keep trades matchable
+        self.ask_quantity: Dict[int, int] = {}
+
+    def offset(self) -> int:
+        if self.distribution == 'uniform':
+            return self.random.randint(1, self.depth)
+        # geometric with a mean of a tenth of the depth, clamped to the depth
+        return min(self.depth, 1 + int(self.random.expovariate(10.0 / self.depth)))
+
+    def messages(self, count: int) -> Iterator[List[str]]:
+        rand = self.random.random
+        for _ in range(count):
+            if self.bad_rate and rand() < self.bad_rate:
+                yield self.bad()
+                continue
+            pick = rand()
+            if pick < self.thresholds[0] or not self.live:
+                yield self.add()
+            elif pick < self.thresholds[1]:
+                yield self.cancel()
+            elif pick < self.thresholds[2]:
+                yield self.modify()
+            else:
+                yield self.trade()
+
+    def add(self) -> List[str]:
+        if self.random.random() < 0.01:
+            self.mid += self.tick if self.random.random() < 0.5 else -self.tick
+        side = Order.BUY_SIDE if self.random.random() < 0.5 else Order.SELL_SIDE
+        offset = self.offset() * self.tick
+        price = self.mid - offset if side == Order.BUY_SIDE else self.mid + offset
+        price = max(price, self.tick)
+        quantity = self.random.randint(1, self.max_quantity)
+        order_id = self.next_id
+        self.next_id += 1
+        self.live.append([order_id, side, quantity, price])
+        if side == Order.SELL_SIDE:
+            self.ask_quantity[price] = self.ask_quantity.get(price, 0) + quantity
+        return [Order.ACTION_ADD, str(order_id), side, str(quantity), str(price)]
+
+    def cancel(self) -> List[str]:
+        order_id, side, quantity, price = self.pop(self.random.randrange(len(self.live)))
+        if side == Order.SELL_SIDE:
+            self.take_ask(price, quantity)
+        return [Order.ACTION_REMOVE, str(order_id), side, str(quantity), str(price)]
+
+    def modify(self) -> List[str]:
+        order = self.live[self.random.randrange(len(self.live))]
+        order_id, side, quantity, price = order
+        new_quantity = self.random.randint(1, self.max_quantity)
+        order[2] = new_quantity
+        if side == Order.SELL_SIDE:
+            self.ask_quantity[price] += new_quantity - quantity
+        return [Order.ACTION_MODIFY, str(order_id), side, str(new_quantity), str(price)]
+
+    def trade(self) -> List[str]:
+        if not self.ask_quantity:
+            return self.add()
+        price = min(self.ask_quantity)
+        quantity = self.random.randint(1, self.ask_quantity[price])
+        return ['T', str(quantity), str(price)]
+
+    def bad(self) -> List[str]:
+        if self.random.random() < 0.5:
+            return self.random.choice(self.BAD_MESSAGES).split(',')
+        return [Order.ACTION_REMOVE, str(self.next_id + 1000000), Order.BUY_SIDE, '1', str(self.mid)]
+
+    def pop(self, index: int) -> List:
+        live = self.live
+        order = live[index]
+        last = live.pop()
+        if last is not order:
+            live[index] = last
+        return order
+
+    def take_ask(self, price: int, quantity: int):
+        left = self.ask_quantity[price] - quantity
+        if left:
+            self.ask_quantity[price] = left
+        else:
+            del self.ask_quantity[price]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic feed to stdout")
+    parser.add_argument('-c', '--count', help='Number of messages', type=int, default=100000)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-d', '--depth', help='Price levels either side of the mid', type=int, default=50)
+    parser.add_argument('--mix', help='Relative add,cancel,modify,trade rates', type=str, default='0.5,0.3,0.15,0.05')
+    parser.add_argument('--bad-rate', help='Fraction of malformed messages', type=float, default=0.0)
+    parser.add_argument('--distribution', choices=('geometric', 'uniform'), default='geometric')
+    args = vars(parser.parse_args())
+
+    add, cancel, modify, trade = [float(rate) for rate in args['mix'].split(',')]
+    generator = FeedGenerator(seed=args['seed'], depth=args['depth'], add=add, cancel=cancel, modify=modify,
+                              trade=trade, bad_rate=args['bad_rate'], distribution=args['distribution'])
+    csv.writer(sys.stdout, lineterminator='\n').writerows(generator.messages(args['count']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import csv
+import heapq
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+from jump.book import Book
+from jump.feed_processor import MessageDispatcher
+
+
+def sequenced_rows(file: IO, index: int) -> Iterator[Tuple[int, int, List[str]]]:
+    """
+    The rows of one partition as (sequence, index, message) tuples, message being the row without its sequence.
+
+    A row whose sequence is missing or not a number keeps its place in the file: it takes the sequence of the row
+    before it and is passed on whole, so the book rejects it like any other malformed row. Each input is expected to
+    be in sequence order already; a row numbered lower than the one before it is also kept in place.
+    """
+    last = None
+    for row in csv.reader(file):
+        try:
+            sequence = int(row[0])
+        except (IndexError, ValueError):
+            yield (last if last is not None else -1), index, row
+            continue
+        if last is not None and sequence < last:
+            sequence = last
+        last = sequence
+        yield sequence, index, row[1:]
+
+
+def merged_rows(files: Iterable[IO]) -> Iterator[List[str]]:
+    """
+    The rows of several partitions of a feed, merged lazily in sequence order.
+
+    Every row starts with a sequence number. heapq.merge keeps only the next row of each input, so memory does not
+    grow with the size of the files; rows with the same sequence come out in the order the files were given.
+    """
+    for _, _, message in heapq.merge(*(sequenced_rows(file, index) for index, file in enumerate(files))):
+        yield message
+
+
+def merge_feed(files: Iterable[IO], book: Book) -> Iterator[Optional[str]]:
+    """csv_feed over the sequence merge of several feed files."""
+    dispatch = MessageDispatcher(book).dispatch
+    for message in merged_rows(files):
+        yield dispatch(message)
@@ -0,0 +1,238 @@
+import asyncio
+import csv
+from collections import deque
+from typing import IO, List, Optional, Tuple
+
+from jump.book import Book
+from jump.feed_processor import MessageDispatcher
+
+# bytes read from a tcp publisher at a time, the whole lines in them make up one batch
+READ_SIZE = 1 << 16
+# batches the queue holds before tcp publishers stop being read
+QUEUE_SIZE = 64
+# characters/bytes of output handed to the writer but not yet written before the book waits for it
+WRITE_LIMIT = 1 << 20
+
+
+def parse_lines(data: bytes) -> List[list]:
+    return list(csv.reader(data.decode(errors='replace').splitlines()))
+
+
+class AsyncWriter(object):
+    """
+    File-like object for a sink to write to from the event loop without blocking it.
+
+    Writes are queued in memory and written out to file by a task in the loop's default executor. drain() waits
+    until no more than limit characters/bytes are pending, so a slow output holds back the book instead of
+    growing the queue without bound.
+    """
+
+    def __init__(self, file: IO, limit: int = WRITE_LIMIT):
+        super().__init__()
+        self.file = file
+        self.limit = limit
+        self.chunks: deque = deque()
+        self.pending = 0
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self.ready: Optional[asyncio.Event] = None
+        self.written: Optional[asyncio.Event] = None
+
+    def start(self):
+        self.ready = asyncio.Event()
+        self.written = asyncio.Event()
+        self.task = asyncio.ensure_future(self.run())
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.pending += len(data)
+        self.ready.set()
+
+    def flush(self):
+        # the writer task flushes the file once it has written everything queued
+        pass
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.chunks:
+                data = self.chunks.popleft()
+                await loop.run_in_executor(None, self.file.write, data)
+                self.pending -= len(data)
+                self.written.set()
+            await loop.run_in_executor(None, self.file.flush)
+            if self.closed and not self.chunks:
+                return
+
+    async def drain(self):
+        while self.pending > self.limit:
+            if self.task.done():
+                # the writer failed, surface its error
+                self.task.result()
+            self.written.clear()
+            await self.written.wait()
+
+    async def close(self):
+        self.closed = True
+        self.ready.set()
+        await self.task
+
+
+class FeedServer(object):
+    """
+    Applies feed rows published over tcp and udp to a book, from any number of publishers at once.
+
+    Each tcp publisher streams csv lines over its own connection; every read becomes a batch of whole lines on a
+    bounded queue. While the queue is full the connection is not read, so the kernel buffers fill up and the
+    publisher's sends block: a fast publisher is slowed down to the rate of the book rather than queued in memory.
+    A udp datagram holds one or more lines and is queued the same way, but udp can not be pushed back on, so
+    datagrams arriving while the queue is full are dropped and counted in dropped.
+
+    A single task applies the batches to the book in arrival order and writes the output like python -m jump: the
+    midquote after every message and the book every 10 messages. Lines from one publisher stay in order, batches
+    from different publishers interleave. Pass an AsyncWriter as writer when the sink writes to one, so the book
+    waits for the output to catch up between batches.
+    """
+
+    def __init__(self, book: Book, state: bool = True, writer: Optional[AsyncWriter] = None,
+                 queue_size: int = QUEUE_SIZE, read_size: int = READ_SIZE):
+        super().__init__()
+        self.book = book
+        self.state = state
+        self.writer = writer
+        self.queue_size = queue_size
+        self.read_size = read_size
+        self.messages = 0
+        self.dropped = 0
+        self.publishers = 0
+        self.connections = set()
+        self.error: Optional[BaseException] = None
+        self.rows: Optional[asyncio.Queue] = None
+        self.closed: Optional[asyncio.Condition] = None
+        self.tcp: Optional[asyncio.AbstractServer] = None
+        self.udp: Optional[asyncio.DatagramTransport] = None
+        self.applier: Optional[asyncio.Task] = None
+
+    async def start(self, host: str = '127.0.0.1', tcp_port: Optional[int] = None, udp_port: Optional[int] = None):
+        """Listen on the given ports, 0 picks a free one (see tcp_address and udp_address)."""
+        self.rows = asyncio.Queue(maxsize=self.queue_size)
+        self.closed = asyncio.Condition()
+        if self.writer is not None:
+            self.writer.start()
+        self.applier = asyncio.ensure_future(self.apply())
+        if tcp_port is not None:
+            self.tcp = await asyncio.start_server(self.receive, host, tcp_port)
+        if udp_port is not None:
+            self.udp, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: DatagramFeed(self), local_addr=(host, udp_port))
+
+    @property
+    def tcp_address(self) -> Tuple[str, int]:
+        return self.tcp.sockets[0].getsockname()[:2]
+
+    @property
+    def udp_address(self) -> Tuple[str, int]:
+        return self.udp.get_extra_info('sockname')[:2]
+
+    async def receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        rest = b''
+        self.connections.add(writer)
+        try:
+            while True:
+                data = await reader.read(self.read_size)
+                if not data:
+                    break
+                data = rest + data
+                # only whole lines are queued, a partial last line waits for the next read
+                cut = data.rfind(b'\n') + 1
+                rest = data[cut:]
+                if cut:
+                    await self.rows.put(parse_lines(data[:cut]))
+            if rest:
+                await self.rows.put(parse_lines(rest))
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+            async with self.closed:
+                self.publishers += 1
+                self.closed.notify_all()
+
+    async def wait_publishers(self, count: int):
+        """Wait until count tcp publishers have disconnected, or the book failed."""
+        async with self.closed:
+            await self.closed.wait_for(lambda: self.publishers >= count or self.error is not None)
+
+    async def apply(self):
+        from jump.__main__ import replay_messages
+
+        book = self.book
+        dispatch = MessageDispatcher(book).dispatch
+        rows = self.rows
+        state = self.state
+        writer = self.writer
+        try:
+            while True:
+                batch = await rows.get()
+                if batch is None:
+                    break
+                self.messages = replay_messages(map(dispatch, batch), book, state, self.messages)
+                book.sink.flush()
+                if writer is not None:
+                    await writer.drain()
+        except BaseException as e:
+            self.error = e
+            async with self.closed:
+                self.closed.notify_all()
+            # keep taking batches so publishers blocked on the queue are not stuck behind the failed book
+            while await rows.get() is not None:
+                pass
+
+    async def stop(self):
+        """
+        Stop listening, apply what has been queued and finish the replay: the end of feed checks, the final book,
+        the ERRORS summary and a flush of the output.
+        """
+        if self.tcp is not None:
+            self.tcp.close()
+            # publishers still connected are cut off, what they already sent is applied
+            for writer in list(self.connections):
+                writer.close()
+            await self.tcp.wait_closed()
+        if self.udp is not None:
+            self.udp.close()
+        await self.rows.put(None)
+        await self.applier
+        if self.error is not None:
+            raise self.error
+        from jump.__main__ import finish_replay, report_errors
+
+        book = self.book
+        finish_replay(book, self.state)
+        report_errors(book.rejects, book.sink)
+        book.sink.flush()
+        if self.writer is not None:
+            await self.writer.close()
+
+
+class DatagramFeed(asyncio.DatagramProtocol):
+    def __init__(self, server: FeedServer):
+        super().__init__()
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            self.server.rows.put_nowait(parse_lines(data))
+        except asyncio.QueueFull:
+            self.server.dropped += 1
+
+
+async def publish(host: str, port: int, feed: bytes, chunk_size: int = READ_SIZE):
+    """Send a feed to a FeedServer over tcp, chunk_size bytes at a time, waiting for each to be taken."""
+    reader, writer = await asyncio.open_connection(host, port)
+    for start in range(0, len(feed), chunk_size):
+        writer.write(feed[start:start + chunk_size])
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
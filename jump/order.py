@@ -1,6 +1,3 @@
-from datetime import datetime
-
-
 class Order(object):
     BUY_SIDE = 'B'
     SELL_SIDE = 'S'
@@ -8,22 +5,34 @@ class Order(object):
     ACTION_MODIFY = 'M'
     ACTION_REMOVE = 'X'
 
+    # a book can hold millions of resting orders, so keep them free of a per-instance __dict__
+    __slots__ = ('id', 'side', 'price', 'quantity', 'action', 'sequence', 'level', 'prev', 'next')
+
     def __init__(self, id=None, side=None, price=None, quantity=None, action=None):
         self.id = id
         self.side = side
         self.price = price
         self.quantity = quantity
         self.action = action
-        self.order_datetime = datetime.utcnow()
+        # time priority, stamped by the book from a monotonic counter whenever the order joins the back of a queue
+        self.sequence = 0
+        # links into the queue of the price level the order rests at, managed by jump.book.PriceLevel
+        self.level = None
+        self.prev = None
+        self.next = None
 
     def validate(self):
-        if not self.id:
+        return Order.is_valid(self.id, self.side, self.price, self.quantity)
+
+    @staticmethod
+    def is_valid(id, side, price, quantity) -> bool:
+        if not id:
             return False
-        if not self.side:
+        if side not in (Order.BUY_SIDE, Order.SELL_SIDE):
             return False
-        if not self.price or self.price < 0:
+        if not price or price < 0:
             return False
-        if not self.quantity:
+        if not quantity:
             return False
 
         return True
@@ -0,0 +1,179 @@
+import csv
+import multiprocessing
+import queue
+import threading
+from typing import Dict, IO, Iterable, Iterator, Optional, Union
+
+from jump.book import Book
+from jump.feed_processor import MessageDispatcher
+from jump.feed_reader import open_feed
+from jump.sink import NullSink, OutputSink, create_sink
+
+# rows per batch handed from the parser to the book, and sink calls per batch handed from the book to the formatter
+BATCH_SIZE = 1024
+# batches a queue holds before the stage feeding it blocks
+QUEUE_SIZE = 16
+
+
+class Stage(object):
+    """
+    One stage of the pipeline, running target in a daemon thread or process.
+
+    The put/get helpers wait on the queues in short timeouts and check the stage is still running in between, so a
+    stage that dies makes the book stage fail instead of blocking forever.
+    """
+
+    def __init__(self, name: str, target, args: tuple, use_process: bool):
+        super().__init__()
+        self.name = name
+        self.error: Optional[BaseException] = None
+        if use_process:
+            self.worker = multiprocessing.Process(target=target, args=args, daemon=True)
+        else:
+            self.worker = threading.Thread(target=self.run_thread, args=(target, args), daemon=True)
+
+    def run_thread(self, target, args: tuple):
+        try:
+            target(*args)
+        except BaseException as e:
+            self.error = e
+
+    def start(self):
+        self.worker.start()
+
+    def put(self, q, item):
+        while True:
+            try:
+                return q.put(item, timeout=1)
+            except queue.Full:
+                self.check()
+
+    def get(self, q):
+        while True:
+            try:
+                return q.get(timeout=1)
+            except queue.Empty:
+                self.check()
+
+    def check(self):
+        if not self.worker.is_alive():
+            self.join()
+            raise RuntimeError('The {} stage exited unexpectedly'.format(self.name))
+
+    def join(self):
+        self.worker.join()
+        if self.error is not None:
+            raise RuntimeError('The {} stage failed'.format(self.name)) from self.error
+        if getattr(self.worker, 'exitcode', 0):
+            raise RuntimeError('The {} stage exited with code {}'.format(self.name, self.worker.exitcode))
+
+
+class QueueSink(OutputSink):
+    """
+    Records every sink call as a (method name, arguments...) tuple and hands them to the formatter in batches.
+
+    Book dumps arrive as generators over the live book, so they are materialised here, before the book changes.
+    """
+
+    def __init__(self, send, batch_size: int = BATCH_SIZE):
+        super().__init__()
+        self.send = send
+        self.batch_size = batch_size
+        self.calls = []
+
+    def record(self, call: tuple):
+        self.calls.append(call)
+        if len(self.calls) >= self.batch_size:
+            self.flush()
+
+    def midquote(self, mid: Optional[float]):
+        self.record(('midquote', mid))
+
+    def trade(self, quantity: int, price: float):
+        self.record(('trade', quantity, price))
+
+    def state(self, sells: Iterable, buys: Iterable):
+        self.record(('state', list(sells), list(buys)))
+
+    def delta(self, sells: Iterable, buys: Iterable):
+        self.record(('delta', list(sells), list(buys)))
+
+    def errors(self, counts: Dict[str, int]):
+        self.record(('errors', dict(counts)))
+
+    def flush(self):
+        if self.calls:
+            self.send(self.calls)
+            self.calls = []
+
+
+def parse_rows(source: Union[str, IO], rows: queue.Queue, batch_size: int):
+    """Parser stage: read csv rows from a path or an open file and put them on the queue in batches."""
+    f = open_feed(source) if isinstance(source, str) else source
+    with f:
+        reader = csv.reader(f)
+        while True:
+            batch = [row for _, row in zip(range(batch_size), reader)]
+            if not batch:
+                break
+            rows.put(batch)
+    rows.put(None)
+
+
+def format_calls(calls: queue.Queue, output_format: str, path: Optional[str], buffer_size: int, decimals: int):
+    """Formatter stage: replay the recorded sink calls on the real sink, writing to path or stdout."""
+    sink = create_sink(output_format, path, buffer_size, decimals=decimals)
+    for batch in iter(calls.get, None):
+        for call in batch:
+            getattr(sink, call[0])(*call[1:])
+    sink.flush()
+    if path and not isinstance(sink, NullSink):
+        sink.file.close()
+
+
+class Pipeline(object):
+    """
+    Runs a replay as three stages: parsing csv rows, applying them to the book and formatting the output.
+
+    The book stays in the calling thread, the only one that touches it; parsing and formatting run in threads or,
+    with use_process, in processes, and batches move between the stages over bounded queues. The formatter
+    replays the book's sink calls in order on the same kind of sink the sequential mode uses, so the output is
+    byte-identical to it.
+    """
+
+    def __init__(self, source: Union[str, IO], path: Optional[str], output_format: str = 'text',
+                 buffer_size: int = 1 << 16, use_process: bool = False, batch_size: int = BATCH_SIZE,
+                 decimals: int = 2):
+        super().__init__()
+        make_queue = multiprocessing.Queue if use_process else queue.Queue
+        self.rows = make_queue(maxsize=QUEUE_SIZE)
+        self.calls = make_queue(maxsize=QUEUE_SIZE)
+        self.parser = Stage('parser', parse_rows, (source, self.rows, batch_size), use_process)
+        self.formatter = Stage('formatter', format_calls, (self.calls, output_format, path, buffer_size, decimals),
+                               use_process)
+        self.sink = QueueSink(lambda batch: self.formatter.put(self.calls, batch), batch_size)
+
+    def __enter__(self):
+        self.parser.start()
+        self.formatter.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def feed(self, book: Book) -> Iterator[Optional[str]]:
+        """Apply the parsed rows to the book, yielding each row's reject code or None like csv_feed."""
+        dispatch = MessageDispatcher(book).dispatch
+        get = self.parser.get
+        rows = self.rows
+        for batch in iter(lambda: get(rows), None):
+            for message in batch:
+                yield dispatch(message)
+        self.parser.join()
+
+    def close(self):
+        """Send what is left to the formatter and wait for it to write everything out."""
+        self.sink.flush()
+        self.formatter.put(self.calls, None)
+        self.formatter.join()
@@ -0,0 +1,220 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zlib
+from queue import Empty, Full
+from typing import Dict, IO, Iterable, List, Optional
+
+from jump.book import Book
+from jump.error import *
+from jump.feed_processor import MessageDispatcher
+from jump.sink import NullSink, TextSink
+from jump.tick import TickSize
+
+# rows handed to a worker process per queue put
+BATCH_SIZE = 1024
+# characters a spooled sink buffers at least, as every flush reopens the spool file
+SPOOL_BUFFER_SIZE = 1 << 12
+
+
+class SpoolFile(object):
+    """File-like object that appends every write to a path, so thousands of symbols don't hold open descriptors."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+
+    def write(self, text: str):
+        with open(self.path, 'a') as f:
+            f.write(text)
+
+    def flush(self):
+        pass
+
+
+class SymbolReplay(object):
+    __slots__ = ('book', 'dispatch', 'count')
+
+    def __init__(self, book: Book):
+        self.book = book
+        self.dispatch = MessageDispatcher(book).dispatch
+        self.count = 0
+
+
+class SymbolBooks(object):
+    """
+    One book per symbol, each replayed exactly like a single-symbol feed.
+
+    Every book writes its output through its own buffered sink into a spool file named after the symbol, so the
+    sections can be stitched together in symbol order once all messages have been applied. Spool output is only read
+    back at the end, so a buffer_size below SPOOL_BUFFER_SIZE is raised to it rather than writing every record through.
+    """
+
+    def __init__(self, spool_dir: Optional[str], fill_trades: bool = False, full_snapshot_every: int = 0,
+                 state: bool = True, buffer_size: int = 1 << 16, tick_size: TickSize = None,
+                 tape_capacity: int = 1024):
+        super().__init__()
+        # no spool directory means output is discarded
+        self.spool_dir = spool_dir
+        self.fill_trades = fill_trades
+        self.full_snapshot_every = full_snapshot_every
+        self.state = state
+        self.buffer_size = buffer_size
+        self.tick_size = tick_size if tick_size is not None else TickSize()
+        self.tape_capacity = tape_capacity
+        self.replays: Dict[str, SymbolReplay] = {}
+
+    def open(self, symbol: str) -> SymbolReplay:
+        if self.spool_dir is None:
+            sink = NullSink()
+        else:
+            sink = TextSink(SpoolFile(spool_path(self.spool_dir, symbol)),
+                            buffer_size=max(self.buffer_size, SPOOL_BUFFER_SIZE),
+                            decimals=self.tick_size.decimals)
+        replay = self.replays[symbol] = SymbolReplay(Book(sink=sink, fill_trades=self.fill_trades,
+                                                          full_snapshot_every=self.full_snapshot_every,
+                                                          tape_capacity=self.tape_capacity,
+                                                          tick_size=self.tick_size))
+        return replay
+
+    def apply(self, symbol: str, message: List[str]):
+        replay = self.replays.get(symbol) or self.open(symbol)
+        replay.dispatch(message)
+        replay.book.midquote()
+        replay.count += 1
+        if not replay.count % 10 and self.state:
+            replay.book.snapshot()
+
+    def finish(self) -> Dict[str, int]:
+        """Close out every book and return the reject counts summed over all of them."""
+        rejects = Rejects()
+        for replay in self.replays.values():
+            book = replay.book
+            book.check_expected_trades()
+            if self.state:
+                book.output_state()
+            book.sink.flush()
+            rejects.merge(book.rejects.counts)
+        return rejects.counts
+
+
+def spool_path(spool_dir: str, symbol: str) -> str:
+    return os.path.join(spool_dir, symbol.encode().hex() or '_')
+
+
+def shard_of(symbol: str, workers: int) -> int:
+    # crc32 rather than hash() so the split is the same in every process and every run
+    return zlib.crc32(symbol.encode()) % workers
+
+
+def run_worker(queue: multiprocessing.Queue, results: multiprocessing.Queue, spool_dir: Optional[str], options: dict):
+    books = SymbolBooks(spool_dir, **options)
+    apply = books.apply
+    for batch in iter(queue.get, None):
+        for symbol, message in batch:
+            apply(symbol, message)
+    results.put((books.finish(), list(books.replays)))
+
+
+def replay_symbols(rows: Iterable[List[str]], outfile: Optional[IO], workers: int = 0, **options) -> Dict[str, int]:
+    """
+    Replay a feed whose rows start with a symbol column, keeping a book per symbol.
+
+    With workers the symbols are sharded over that many processes, otherwise every book lives in this process. The
+    output of each symbol is written to outfile as its own section, in symbol order, and the merged error counts are
+    returned. Rows too short to carry a symbol and a message are counted as invalid messages.
+    """
+    spool_dir = tempfile.mkdtemp(prefix='jump-') if outfile is not None else None
+    try:
+        if workers:
+            counts, symbols = run_pool(rows, workers, spool_dir, options)
+        else:
+            books = SymbolBooks(spool_dir, **options)
+            invalid = 0
+            for row in rows:
+                if len(row) < 2:
+                    invalid += 1
+                else:
+                    books.apply(row[0], row[1:])
+            counts = books.finish()
+            counts[INVALID_MESSAGE] += invalid
+            symbols = list(books.replays)
+
+        if outfile is not None:
+            for symbol in sorted(symbols):
+                outfile.write("SYMBOL,{}\n".format(symbol))
+                path = spool_path(spool_dir, symbol)
+                if os.path.exists(path):
+                    with open(path, 'r') as f:
+                        shutil.copyfileobj(f, outfile)
+        return counts
+    finally:
+        if spool_dir is not None:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def run_pool(rows: Iterable[List[str]], workers: int, spool_dir: Optional[str], options: dict):
+    results = multiprocessing.Queue()
+    # bounded so a slow worker pushes back on the reader instead of buffering the feed in memory
+    queues = [multiprocessing.Queue(maxsize=16) for _ in range(workers)]
+    processes = [multiprocessing.Process(target=run_worker, args=(queue, results, spool_dir, options), daemon=True)
+                 for queue in queues]
+    for process in processes:
+        process.start()
+
+    batches = [[] for _ in range(workers)]
+    shards: Dict[str, int] = {}
+    invalid = 0
+    for row in rows:
+        if len(row) < 2:
+            invalid += 1
+            continue
+        symbol = row[0]
+        shard = shards.get(symbol)
+        if shard is None:
+            shard = shards[symbol] = shard_of(symbol, workers)
+        batch = batches[shard]
+        batch.append((symbol, row[1:]))
+        if len(batch) >= BATCH_SIZE:
+            put(queues[shard], batch, processes)
+            batches[shard] = []
+
+    for queue, batch in zip(queues, batches):
+        if batch:
+            put(queue, batch, processes)
+        put(queue, None, processes)
+
+    rejects = Rejects()
+    rejects.counts[INVALID_MESSAGE] += invalid
+    symbols = []
+    for _ in processes:
+        worker_counts, worker_symbols = get(results, processes)
+        rejects.merge(worker_counts)
+        symbols.extend(worker_symbols)
+    for process in processes:
+        process.join()
+    return rejects.counts, symbols
+
+
+def put(queue: multiprocessing.Queue, item, processes: List[multiprocessing.Process]):
+    while True:
+        try:
+            return queue.put(item, timeout=1)
+        except Full:
+            check_workers(processes)
+
+
+def get(queue: multiprocessing.Queue, processes: List[multiprocessing.Process]):
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            check_workers(processes)
+
+
+def check_workers(processes: List[multiprocessing.Process]):
+    # a worker that died would otherwise leave the reader blocked on its queue forever
+    for process in processes:
+        if process.exitcode:
+            raise RuntimeError('Worker process {} exited with code {}'.format(process.pid, process.exitcode))
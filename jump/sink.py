@@ -0,0 +1,307 @@
+import math
+import struct
+import sys
+from abc import ABC, abstractmethod
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from jump.error import ERROR_CODES
+
+
+class OutputSink(ABC):
+    """
+    Destination for everything the book reports.
+
+    The book hands over raw values and the sink decides how to format and when to write them, so output can be
+    batched, encoded differently or dropped entirely.
+    """
+
+    @abstractmethod
+    def midquote(self, mid: Optional[float]):
+        ...
+
+    @abstractmethod
+    def trade(self, quantity: int, price: float):
+        ...
+
+    @abstractmethod
+    def state(self, sells: Iterable, buys: Iterable):
+        """
+        Write a book dump, each side is an iterable of (price, quantities) pairs from the highest price down: the
+        decimal price and the quantity of each order resting there, in queue order.
+        """
+        ...
+
+    @abstractmethod
+    def delta(self, sells: Iterable, buys: Iterable):
+        """Write the (price, quantities) pairs changed since the previous dump, removed levels have no quantities."""
+        ...
+
+    @abstractmethod
+    def errors(self, counts: Dict[str, int]):
+        ...
+
+    def flush(self):
+        pass
+
+
+class NullSink(OutputSink):
+    """Discards all output, for benchmarking the book itself."""
+
+    def midquote(self, mid: Optional[float]):
+        pass
+
+    def trade(self, quantity: int, price: float):
+        pass
+
+    def state(self, sells: Iterable, buys: Iterable):
+        pass
+
+    def delta(self, sells: Iterable, buys: Iterable):
+        pass
+
+    def errors(self, counts: Dict[str, int]):
+        pass
+
+
+class TextSink(OutputSink):
+    """
+    Writes the plain text output format, buffering formatted lines until buffer_size characters are pending.
+
+    A buffer_size of 0 writes every record through as soon as it is formatted. Midquotes and level prices are written
+    with `decimals` places, TickSize.decimals for the book's tick.
+    """
+
+    def __init__(self, file: IO, buffer_size: int = 1 << 16, decimals: int = 2):
+        super().__init__()
+        self.file = file
+        self.buffer_size = buffer_size
+        self.midquote_format = '{{:.{}f}}\n'.format(decimals)
+        self.level_format = '{{:.{}f}},{{}}\n'.format(decimals)
+        self.buffer = []
+        self.size = 0
+
+    def write(self, text: str):
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def midquote(self, mid: Optional[float]):
+        self.write('NaN\n' if mid is None else self.midquote_format.format(mid))
+
+    def trade(self, quantity: int, price: float):
+        self.write("{}@{}\n".format(quantity, price))
+
+    def state(self, sells: Iterable, buys: Iterable):
+        self.write(self.format_levels(("SELLS", sells), ("BUYS", buys)))
+
+    def delta(self, sells: Iterable, buys: Iterable):
+        # removed levels come out as a price with no quantities after it
+        self.write(self.format_levels(("SELLS DELTA", sells), ("BUYS DELTA", buys)))
+
+    def format_levels(self, *sides) -> str:
+        level_format = self.level_format
+        lines = []
+        for header, levels in sides:
+            lines.append("{}:\n".format(header))
+            for price, quantities in levels:
+                lines.append(level_format.format(price, ",".join(map(str, quantities))))
+        return "".join(lines)
+
+    def errors(self, counts: Dict[str, int]):
+        lines = ["ERRORS:\n"]
+        for code in ERROR_CODES:
+            if counts.get(code):
+                lines.append("{},{}\n".format(code, counts[code]))
+        self.write("".join(lines))
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer = []
+            self.size = 0
+        self.file.flush()
+
+
+class BinarySink(OutputSink):
+    """
+    Writes fixed-layout little-endian records into a bytes buffer, flushed once buffer_size bytes are pending.
+
+    Every record starts with a one byte tag:
+
+    - ``Q`` midquote: float64 mid, NaN when either side is empty
+    - ``T`` trade: int64 running quantity, float64 price
+    - ``S`` state: uint32 sell level count, uint32 buy level count, then per level float64 price, uint32 order count
+      and an int64 quantity per order
+    - ``D`` delta: laid out like ``S`` but holding only the changed levels, removed levels have no orders
+    - ``E`` errors: an int64 count for each of the error codes a to f
+    """
+
+    MIDQUOTE = struct.Struct('<cd')
+    TRADE = struct.Struct('<cqd')
+    STATE = struct.Struct('<cII')
+    LEVEL = struct.Struct('<dI')
+    ERRORS = struct.Struct('<c6q')
+
+    def __init__(self, file: IO, buffer_size: int = 1 << 16):
+        super().__init__()
+        self.file = file
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+
+    def midquote(self, mid: Optional[float]):
+        self.buffer += self.MIDQUOTE.pack(b'Q', math.nan if mid is None else mid)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def trade(self, quantity: int, price: float):
+        self.buffer += self.TRADE.pack(b'T', quantity, price)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def state(self, sells: Iterable, buys: Iterable):
+        self.write_levels(b'S', list(sells), list(buys))
+
+    def delta(self, sells: Iterable, buys: Iterable):
+        self.write_levels(b'D', list(sells), list(buys))
+
+    def write_levels(self, tag: bytes, sells: List, buys: List):
+        buffer = self.buffer
+        buffer += self.STATE.pack(tag, len(sells), len(buys))
+        for price, quantities in sells + buys:
+            buffer += self.LEVEL.pack(price, len(quantities))
+            buffer += struct.pack('<{}q'.format(len(quantities)), *quantities)
+        if len(buffer) >= self.buffer_size:
+            self.flush()
+
+    def errors(self, counts: Dict[str, int]):
+        self.buffer += self.ERRORS.pack(b'E', *[counts.get(code, 0) for code in ERROR_CODES])
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+        self.file.flush()
+
+
+class ConflatingSink(OutputSink):
+    """
+    Thins out the midquotes and trades passed on to another sink, so repeated values are neither formatted nor
+    written.
+
+    - changes_only drops a midquote equal to the last one passed on.
+    - every keeps only the last midquote of every `every` messages, the book reporting one per message.
+    - coalesce_trades holds back the running quantity@price of a trade while the next trade is at the same price,
+      so a run of trades at one price comes out as a single line with its total. The line is passed on when a
+      trade at another price arrives or before the next book dump.
+
+    Whatever is still held back at the end of the feed is passed on before the ERRORS summary.
+    """
+
+    NOT_SENT = object()
+
+    def __init__(self, sink: OutputSink, changes_only: bool = False, every: int = 1, coalesce_trades: bool = False):
+        super().__init__()
+        self.sink = sink
+        self.changes_only = changes_only
+        self.every = every
+        self.coalesce_trades = coalesce_trades
+        self.count = 0
+        # the pending midquote of the current window and the last one passed on, NOT_SENT when there is none
+        self.pending = self.NOT_SENT
+        self.last = self.NOT_SENT
+        self.pending_trade: Optional[Tuple[int, float]] = None
+
+    def midquote(self, mid: Optional[float]):
+        if self.every > 1:
+            self.count += 1
+            if self.count < self.every:
+                self.pending = mid
+                return
+            self.count = 0
+            self.pending = self.NOT_SENT
+        if self.changes_only:
+            if mid == self.last:
+                return
+            self.last = mid
+        self.sink.midquote(mid)
+
+    def trade(self, quantity: int, price: float):
+        if not self.coalesce_trades:
+            self.sink.trade(quantity, price)
+            return
+        if self.pending_trade is not None and self.pending_trade[1] != price:
+            self.sink.trade(*self.pending_trade)
+        self.pending_trade = (quantity, price)
+
+    def send_trade(self):
+        if self.pending_trade is not None:
+            self.sink.trade(*self.pending_trade)
+            self.pending_trade = None
+
+    def state(self, sells: Iterable, buys: Iterable):
+        self.send_trade()
+        self.sink.state(sells, buys)
+
+    def delta(self, sells: Iterable, buys: Iterable):
+        self.send_trade()
+        self.sink.delta(sells, buys)
+
+    def errors(self, counts: Dict[str, int]):
+        self.send_trade()
+        if self.pending is not self.NOT_SENT:
+            # close the window early
+            self.count = self.every - 1
+            self.midquote(self.pending)
+        self.sink.errors(counts)
+
+    def flush(self):
+        self.sink.flush()
+
+
+def create_sink(output_format: str, path: Optional[str], buffer_size: int, append: bool = False,
+                decimals: int = 2) -> OutputSink:
+    if output_format == 'null':
+        return NullSink()
+    elif output_format == 'binary':
+        return BinarySink(open(path, 'ab' if append else 'wb') if path else sys.stdout.buffer,
+                          buffer_size=buffer_size)
+    return TextSink(open(path, 'a' if append else 'w') if path else sys.stdout, buffer_size=buffer_size,
+                    decimals=decimals)
+
+
+def read_binary(data: bytes) -> Iterator[Tuple]:
+    """
+    Decode a BinarySink stream into tuples: ('Q', mid), ('T', quantity, price), ('E', counts) and
+    ('S', sells, buys) or ('D', sells, buys) where each side is a list of (price, [quantity, ...]).
+    """
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        tag = bytes(view[pos:pos + 1])
+        if tag == b'Q':
+            _, mid = BinarySink.MIDQUOTE.unpack_from(view, pos)
+            pos += BinarySink.MIDQUOTE.size
+            yield 'Q', None if math.isnan(mid) else mid
+        elif tag == b'T':
+            _, quantity, price = BinarySink.TRADE.unpack_from(view, pos)
+            pos += BinarySink.TRADE.size
+            yield 'T', quantity, price
+        elif tag in (b'S', b'D'):
+            _, sell_count, buy_count = BinarySink.STATE.unpack_from(view, pos)
+            pos += BinarySink.STATE.size
+            levels = []
+            for _ in range(sell_count + buy_count):
+                price, count = BinarySink.LEVEL.unpack_from(view, pos)
+                pos += BinarySink.LEVEL.size
+                levels.append((price, list(struct.unpack_from('<{}q'.format(count), view, pos))))
+                pos += 8 * count
+            yield tag.decode(), levels[:sell_count], levels[sell_count:]
+        elif tag == b'E':
+            counts = BinarySink.ERRORS.unpack_from(view, pos)[1:]
+            pos += BinarySink.ERRORS.size
+            yield 'E', dict(zip(ERROR_CODES, counts))
+        else:
+            raise ValueError('Unknown binary record tag {!r} at offset {}'.format(tag, pos))
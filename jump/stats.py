@@ -0,0 +1,191 @@
+import csv
+import json
+import time
+from typing import Dict, IO, Iterator, List, Optional
+
+from jump.book import Book
+from jump.error import *
+from jump.feed_processor import MessageDispatcher
+
+# label for messages whose type the feed does not expose, such as rows merged from several files
+ANY_MESSAGE = '*'
+MESSAGE_TYPES = ('A', 'X', 'M', 'T')
+
+
+class Histogram(object):
+    """
+    Latency histogram over power of two nanosecond buckets.
+
+    Recording a sample is a bit_length(), two additions and a comparison for the maximum, percentiles are reported as
+    the upper bound of the bucket they fall in.
+    """
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns: int):
+        self.buckets[ns.bit_length()] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, p: float) -> int:
+        target = self.count * p / 100
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return (1 << bucket) - 1
+        return 0
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ns': self.total,
+            'mean_ns': self.total // self.count if self.count else 0,
+            'p50_ns': self.percentile(50),
+            'p90_ns': self.percentile(90),
+            'p99_ns': self.percentile(99),
+            'max_ns': self.max,
+        }
+
+
+class Stats(object):
+    """
+    Instrumentation for a replay: message counts and latencies per type, time spent parsing and writing output,
+    book depth sampled every depth_interval messages and error counts.
+
+    Nothing here runs unless a Stats is handed to replay(); the plain replay loop has no hooks, so a run without
+    --stats pays nothing for it.
+    """
+
+    def __init__(self, depth_interval: int = 1000):
+        super().__init__()
+        self.depth_interval = depth_interval
+        self.messages = 0
+        self.parse_ns = 0
+        self.elapsed_ns = 0
+        self.dispatch: Dict[str, Histogram] = {}
+        self.midquote = Histogram()
+        self.snapshot = Histogram()
+        # (messages so far, resting orders, bid levels, ask levels)
+        self.depth: List[tuple] = []
+        self.errors = Rejects().counts
+
+    def histogram(self, message_type: str) -> Histogram:
+        histogram = self.dispatch.get(message_type)
+        if histogram is None:
+            histogram = self.dispatch[message_type] = Histogram()
+        return histogram
+
+    def csv_feed(self, file: IO, book: Book) -> Iterator[Optional[str]]:
+        """csv_feed with the csv parsing and the dispatch of each message type timed separately."""
+        dispatch = MessageDispatcher(book).dispatch
+        reader = iter(csv.reader(file))
+        clock = time.perf_counter_ns
+        while True:
+            start = clock()
+            message = next(reader, None)
+            parsed = clock()
+            if message is None:
+                return
+            self.parse_ns += parsed - start
+            code = dispatch(message)
+            message_type = message[0] if message and message[0] in MESSAGE_TYPES else 'invalid'
+            self.histogram(message_type).record(clock() - parsed)
+            yield code
+
+    def wrap(self, feed: Iterator[Optional[str]]) -> Iterator[Optional[str]]:
+        """Time any other feed, parsing and dispatch are then counted together under '*'."""
+        histogram = self.histogram(ANY_MESSAGE)
+        clock = time.perf_counter_ns
+        while True:
+            start = clock()
+            code = next(feed, StopIteration)
+            if code is StopIteration:
+                return
+            histogram.record(clock() - start)
+            yield code
+
+    def replay(self, feed: Iterator[Optional[str]], book: Book, state: bool = True):
+        """
+        Run python -m jump's replay loop with the output steps timed and the book depth sampled, by wrappers the loop
+        calls in place of the book's midquote and snapshot.
+        """
+        from jump.__main__ import replay
+
+        clock = time.perf_counter_ns
+        midquote, snapshot = book.midquote, book.snapshot
+        midquotes, snapshots, depth, interval = self.midquote, self.snapshot, self.depth, self.depth_interval
+        ctr = 0
+
+        def timed_midquote():
+            nonlocal ctr
+            start = clock()
+            midquote()
+            midquotes.record(clock() - start)
+            ctr += 1
+            if not ctr % interval:
+                depth.append((ctr, len(book.orders), len(book.bids), len(book.asks)))
+
+        def timed_snapshot():
+            start = clock()
+            snapshot()
+            snapshots.record(clock() - start)
+
+        book.midquote = timed_midquote
+        book.snapshot = timed_snapshot
+        begin = clock()
+        try:
+            replay(feed, book, state)
+        finally:
+            del book.midquote, book.snapshot
+        self.elapsed_ns = clock() - begin
+        self.messages = ctr
+        depth.append((ctr, len(book.orders), len(book.bids), len(book.asks)))
+        self.errors = dict(book.rejects.counts)
+
+    def to_dict(self) -> dict:
+        seconds = self.elapsed_ns / 1e9
+        return {
+            'messages': self.messages,
+            'elapsed_ns': self.elapsed_ns,
+            'msg_per_sec': self.messages / seconds if seconds else 0.0,
+            'parse_ns': self.parse_ns,
+            'dispatch': {message_type: histogram.to_dict() for message_type, histogram in
+                         sorted(self.dispatch.items())},
+            'midquote': self.midquote.to_dict(),
+            'snapshot': self.snapshot.to_dict(),
+            'depth': [dict(zip(('messages', 'orders', 'bid_levels', 'ask_levels'), sample)) for sample in self.depth],
+            'errors': self.errors,
+            'error_rate': sum(self.errors.values()) / self.messages if self.messages else 0.0,
+        }
+
+    def write_json(self, file: IO):
+        json.dump(self.to_dict(), file, indent=2)
+        file.write("\n")
+
+    def report(self, file: IO):
+        stats = self.to_dict()
+        elapsed = stats['elapsed_ns'] or 1
+        file.write("STATS:\n")
+        file.write("messages,{},{:.0f} msg/s\n".format(stats['messages'], stats['msg_per_sec']))
+        file.write("parse,{:.1%}\n".format(stats['parse_ns'] / elapsed))
+        for name, histogram in list(stats['dispatch'].items()) + [('midquote', stats['midquote']),
+                                                                  ('snapshot', stats['snapshot'])]:
+            file.write("{},{} calls,{:.1%},mean {}ns,p50 {}ns,p90 {}ns,p99 {}ns,max {}ns\n".format(
+                name, histogram['count'], histogram['total_ns'] / elapsed, histogram['mean_ns'], histogram['p50_ns'],
+                histogram['p90_ns'], histogram['p99_ns'], histogram['max_ns']))
+        last = stats['depth'][-1]
+        file.write("depth,{} orders,{} bid levels,{} ask levels,peak {} orders\n".format(
+            last['orders'], last['bid_levels'], last['ask_levels'],
+            max(sample['orders'] for sample in stats['depth'])))
+        file.write("errors,{},{:.2%}\n".format(
+            ",".join("{}={}".format(code, count) for code, count in stats['errors'].items() if count) or 'none',
+            stats['error_rate']))
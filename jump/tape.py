@@ -0,0 +1,80 @@
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+from jump.trade import Trade
+
+
+class PriceVolume(object):
+    """Traded volume and trade count at one price."""
+
+    __slots__ = ('price', 'volume', 'count')
+
+    def __init__(self, price: int):
+        self.price = price
+        self.volume = 0
+        self.count = 0
+
+
+class TradeTape(object):
+    """
+    The most recent trades in a ring buffer of fixed capacity, plus aggregates over every trade of the session.
+
+    Recording a trade appends it to the ring, pushing out the oldest once the tape is full, and adds it to the
+    session totals and to the totals of its price, so memory stays bounded by the capacity and the number of
+    prices traded, and every query below is answered without scanning trades. Prices are in ticks, like
+    everywhere in the book.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        super().__init__()
+        self.capacity = capacity
+        self.recent: deque = deque(maxlen=capacity)
+        self.count = 0
+        self.volume = 0
+        # sum of price * quantity, for the vwap
+        self.notional = 0
+        self.prices: Dict[int, PriceVolume] = {}
+
+    def __len__(self):
+        """Trades currently held in the tape, at most the capacity."""
+        return len(self.recent)
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __iter__(self) -> Iterator[Trade]:
+        """Iterate the trades held in the tape from the oldest to the newest."""
+        return iter(self.recent)
+
+    def record(self, trade: Trade):
+        self.recent.append(trade)
+        self.count += 1
+        self.volume += trade.quantity
+        self.notional += trade.price * trade.quantity
+        at_price = self.prices.get(trade.price)
+        if at_price is None:
+            at_price = self.prices[trade.price] = PriceVolume(trade.price)
+        at_price.volume += trade.quantity
+        at_price.count += 1
+
+    def last(self, n: int = 1) -> List[Trade]:
+        """The n most recent trades still in the tape, newest last."""
+        trades = list(islice(reversed(self.recent), max(n, 0)))
+        trades.reverse()
+        return trades
+
+    def vwap(self) -> Optional[float]:
+        """Volume weighted average price of the session in (fractional) ticks, None before the first trade."""
+        return self.notional / self.volume if self.volume else None
+
+    def volume_at(self, price: int) -> int:
+        at_price = self.prices.get(price)
+        return at_price.volume if at_price is not None else 0
+
+    def count_at(self, price: int) -> int:
+        at_price = self.prices.get(price)
+        return at_price.count if at_price is not None else 0
+
+    def traded_prices(self) -> List[int]:
+        return sorted(self.prices)
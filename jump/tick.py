@@ -0,0 +1,73 @@
+from fractions import Fraction
+from typing import Optional
+
+# without a tick size prices are kept to this many decimal places, enough for any price a feed sends
+FINE_DECIMALS = 9
+
+
+class TickSize(object):
+    """
+    Converts between decimal prices and the whole numbers of ticks the book works in.
+
+    Integer prices compare, hash and add exactly, so price levels, matching and aggregates never depend on float
+    equality. Feed prices are converted when they are parsed and turned back into decimals only when they are
+    written out: the tick is kept as an exact fraction, so a price is printed as the same float its decimal text
+    parsed to.
+
+    With a tick, a price that is not a whole number of ticks has no tick price and is refused rather than moved to
+    the nearest tick. Without one (tick None) the tick is 10 ** -FINE_DECIMALS and prices are rounded to it, so the
+    book takes prices as the feed gives them. A price that is not finite is refused either way.
+
+    Prices are written out with `decimals` places: two without a tick, otherwise as many as the tick needs, and never
+    fewer than two.
+    """
+
+    def __init__(self, tick=None):
+        super().__init__()
+        self.exact = tick is not None
+        tick = Fraction(str(tick)) if tick is not None else Fraction(1, 10 ** FINE_DECIMALS)
+        if tick <= 0:
+            raise ValueError('Tick size must be positive: {}'.format(tick))
+        self.numerator = tick.numerator
+        self.denominator = tick.denominator
+        self.ticks_per_unit = tick.denominator / tick.numerator
+        self.decimals = 2
+        if self.exact:
+            # a tick with no exact decimal within FINE_DECIMALS places, like 1/3, is written to FINE_DECIMALS places
+            self.decimals = next((places for places in range(2, FINE_DECIMALS)
+                                  if 10 ** places % tick.denominator == 0), FINE_DECIMALS)
+
+    def __eq__(self, other):
+        return isinstance(other, TickSize) and (self.exact, self.numerator, self.denominator) == (
+            other.exact, other.numerator, other.denominator)
+
+    def __repr__(self):
+        if not self.exact:
+            return 'TickSize()'
+        return 'TickSize({!r})'.format(str(Fraction(self.numerator, self.denominator)))
+
+    def to_ticks(self, text) -> Optional[int]:
+        """Parse a price from a str or bytes field, None if it is not finite or, with a tick, falls between two."""
+        price = float(text)
+        try:
+            ticks = round(price * self.ticks_per_unit)
+        except (OverflowError, ValueError):
+            return None
+        # the division is correctly rounded, so it gives back the parsed float exactly when the price is on a tick
+        if self.exact and ticks * self.numerator / self.denominator != price:
+            return None
+        return ticks
+
+    def to_price(self, ticks: int) -> float:
+        return ticks * self.numerator / self.denominator
+
+    def midpoint(self, bid: int, ask: int) -> float:
+        """
+        The decimal price halfway between two tick prices.
+
+        Averaged from the two decimal prices rather than worked out exactly, so a midquote that falls on a half
+        cent rounds the same way in the output as it did when prices were floats.
+        """
+        numerator = self.numerator
+        denominator = self.denominator
+        return (bid * numerator / denominator + ask * numerator / denominator) / 2
@@ -1,5 +1,7 @@
 class Trade(object):
+    __slots__ = ('price', 'quantity')
+
     def __init__(self, price=None, quantity=None):
         super().__init__()
         self.price = price
-        self.quantity = quantity
\ No newline at end of file
+        self.quantity = quantity
@@ -3,6 +3,8 @@ import unittest
 from jump.book import Book
 from jump.error import TradeNotMatchedError
 from jump.order import Order
+from jump.sink import TextSink
+from jump.tick import TickSize
 from jump.trade import Trade
 
 
@@ -48,6 +50,28 @@ class TestBook(unittest.TestCase):
         book.add_order(buy1)
         book.add_trade(trade)
 
+    def test_match_price_time_priority(self):
+        book = Book()
+        sell1 = Order(side='S', price=1030, id=1000, quantity=2, action='A')
+        sell2 = Order(side='S', price=1025, id=1001, quantity=5, action='A')
+        sell3 = Order(side='S', price=1025, id=1002, quantity=5, action='A')
+        for order in (sell1, sell2, sell3):
+            book.add_order(order)
+        matched = book.match(Trade(price=1030, quantity=6))
+        self.assertEqual([order.id for order in matched], [1001, 1002])
+        self.assertEqual(book.orders[1001].quantity, 5)
+
+    def test_match_fill_trades(self):
+        book = Book(fill_trades=True)
+        sell1 = Order(side='S', price=1030, id=1000, quantity=2, action='A')
+        sell2 = Order(side='S', price=1025, id=1001, quantity=5, action='A')
+        book.add_order(sell1)
+        book.add_order(sell2)
+        book.add_trade(Trade(price=1030, quantity=6))
+        self.assertNotIn(1001, book.orders)
+        self.assertEqual(book.orders[1000].quantity, 1)
+        self.assertEqual(book.best_ask(), 1030)
+
     def test_best_buy(self):
         book = Book()
         buy1 = Order(side='B', price=1030, id=1000, quantity=2, action='A')
@@ -56,7 +80,7 @@ class TestBook(unittest.TestCase):
         book.add_order(buy1)
         book.add_order(buy2)
         book.add_order(buy3)
-        self.assertEqual(book.best_buy.pop(), 1035)
+        self.assertEqual(book.best_bid(), 1035)
 
     def test_best_sell(self):
         book = Book()
@@ -66,7 +90,36 @@ class TestBook(unittest.TestCase):
         book.add_order(sell1)
         book.add_order(sell2)
         book.add_order(sell3)
-        self.assertEqual(book.best_sell.pop(), 1025)
+        self.assertEqual(book.best_ask(), 1025)
+
+    def test_best_after_remove(self):
+        book = Book()
+        buy1 = Order(side='B', price=1030, id=1000, quantity=2, action='A')
+        buy2 = Order(side='B', price=1035, id=1001, quantity=5, action='A')
+        sell1 = Order(side='S', price=1040, id=1002, quantity=5, action='A')
+        sell2 = Order(side='S', price=1045, id=1003, quantity=5, action='A')
+        for order in (buy1, buy2, sell1, sell2):
+            book.add_order(order)
+        book.remove_order(Order(side='B', price=1035, id=1001, quantity=5, action='X'))
+        book.remove_order(Order(side='S', price=1040, id=1002, quantity=5, action='X'))
+        self.assertEqual(book.best_bid(), 1030)
+        self.assertEqual(book.best_ask(), 1045)
+        self.assertEqual(len(book.bids), 1)
+        self.assertEqual(len(book.asks), 1)
+
+    def test_output_state_sorted(self):
+        import io
+        book = Book(tick_size=TickSize(1))
+        book.add_order(Order(side='B', price=1000, id=1000, quantity=9, action='A'))
+        book.add_order(Order(side='B', price=1050, id=1001, quantity=3, action='A'))
+        book.add_order(Order(side='B', price=1000, id=1002, quantity=1, action='A'))
+        book.add_order(Order(side='S', price=1075, id=1003, quantity=1, action='A'))
+        book.add_order(Order(side='S', price=1060, id=1004, quantity=2, action='A'))
+        out = io.StringIO()
+        book.sink = TextSink(out)
+        book.output_state()
+        book.sink.flush()
+        self.assertEqual(out.getvalue(), 'SELLS:\n1075.00,1\n1060.00,2\nBUYS:\n1050.00,3\n1000.00,9,1\n')
 
     def test_add_trade(self):
         book = Book()
@@ -80,7 +133,21 @@ class TestBook(unittest.TestCase):
         trade2 = Trade(price=1025, quantity=1)
         book.add_trade(trade1)
         book.add_trade(trade2)
-        self.assertEqual(len(book.trades[1025]), 2)
+        self.assertEqual(book.tape.count_at(1025), 2)
+        self.assertEqual(book.tape.volume_at(1025), 3)
+
+    def test_trade_tape(self):
+        from jump.tape import TradeTape
+        tape = TradeTape(capacity=2)
+        self.assertIsNone(tape.vwap())
+        for price, quantity in ((1025, 2), (1030, 1), (1025, 1)):
+            tape.record(Trade(price=price, quantity=quantity))
+        self.assertEqual([(trade.price, trade.quantity) for trade in tape], [(1030, 1), (1025, 1)])
+        self.assertEqual([trade.price for trade in tape.last()], [1025])
+        self.assertEqual((tape.count, tape.volume, len(tape)), (3, 4, 2))
+        self.assertEqual(tape.vwap(), (1025 * 3 + 1030) / 4)
+        self.assertEqual((tape.volume_at(1025), tape.count_at(1025), tape.volume_at(1000)), (3, 2, 0))
+        self.assertEqual(tape.traded_prices(), [1025, 1030])
 
     def test_remove(self):
         order1 = Order(side='B', price=1025, id=10000, quantity=1)
@@ -115,12 +182,71 @@ class TestBook(unittest.TestCase):
         book.modify_order(order1_mod)
         self.assertEqual(book.orders[10000].quantity, 5)
 
+    def test_modify_queue_priority(self):
+        book = Book()
+        for order_id in (1000, 1001, 1002):
+            book.add_order(Order(side='S', price=1025, id=order_id, quantity=5, action='A'))
+        level = book.asks.get(1025)
+        book.modify_order(Order(side='S', price=1025, id=1000, quantity=3, action='M'))
+        self.assertEqual([order.id for order in level], [1000, 1001, 1002])
+        book.modify_order(Order(side='S', price=1025, id=1001, quantity=8, action='M'))
+        self.assertEqual([order.id for order in level], [1000, 1002, 1001])
+        book.modify_order(Order(side='S', price=1030, id=1000, quantity=3, action='M'))
+        self.assertEqual([order.id for order in level], [1002, 1001])
+        self.assertEqual([order.id for order in book.asks.get(1030)], [1000])
+
+    def test_remove_from_middle_of_level(self):
+        book = Book()
+        for order_id in (1000, 1001, 1002):
+            book.add_order(Order(side='B', price=1025, id=order_id, quantity=5, action='A'))
+        book.remove_order(Order(side='B', price=1025, id=1001, quantity=2, action='X'))
+        level = book.bids.get(1025)
+        self.assertEqual([order.quantity for order in level], [5, 3, 5])
+        book.remove_order(Order(side='B', price=1025, id=1001, quantity=3, action='X'))
+        self.assertEqual([order.id for order in level], [1000, 1002])
+        self.assertEqual(len(level), 2)
+
+    def test_sequence_priority(self):
+        book = Book()
+        first = Order(side='B', price=1025, id=1000, quantity=5, action='A')
+        second = Order(side='B', price=1025, id=1001, quantity=5, action='A')
+        book.add_order(first)
+        book.add_order(second)
+        self.assertLess(first.sequence, second.sequence)
+        book.apply_modify(1000, 'B', 6, 1025)
+        self.assertGreater(first.sequence, second.sequence)
+        book.apply_remove(1001, 'B', 5, 1025)
+        self.assertEqual(list(book.orders), [1000])
+
     def test_bad_message(self):
         from jump.feed_processor import ProcessorFactory
         from jump.error import InvalidMessageError
         with self.assertRaises(InvalidMessageError):
             ProcessorFactory.create_processor('BADMESSAGE', Book())
 
+    def test_dispatcher(self):
+        from jump.feed_processor import MessageDispatcher
+        book = Book()
+        dispatcher = MessageDispatcher(book)
+        dispatcher.dispatch(['A', '1000', 'S', '5', '1025'])
+        dispatcher.dispatch(['M', '1000', 'S', '4', '1025'])
+        dispatcher.dispatch(['T', '2', '1025'])
+        self.assertEqual(book.orders[1000].quantity, 4)
+        self.assertEqual(book.total_quantity, 2)
+        for message in ('BADMESSAGE', [], ['T', '2', '1025', '1'], ['A', '1001', 'S', '5']):
+            self.assertEqual(dispatcher.dispatch(message), 'a')
+        self.assertEqual(dispatcher.dispatch(['X', '1001', 'S', '5', '1025']), 'd')
+        self.assertEqual(book.rejects.counts, {'a': 4, 'b': 0, 'c': 0, 'd': 1, 'e': 0, 'f': 0})
+
+    def test_reject_samples(self):
+        from jump.feed_processor import MessageDispatcher
+        book = Book(reject_samples=2)
+        dispatcher = MessageDispatcher(book)
+        for message in (['X', '1', 'B', '1', '1'], 'BADMESSAGE', ['T', '5', '1000'], ['A', '1', 'B', '1', '1']):
+            dispatcher.dispatch(message)
+        self.assertEqual(book.rejects.total(), 3)
+        self.assertEqual(list(book.rejects.samples), [('a', 'BADMESSAGE'), ('c', ['T', '5', '1000'])])
+
     def test_best_with_no_trades(self):
         from jump.error import BestPriceButNoTradeError
         book = Book()
@@ -138,6 +264,558 @@ class TestBook(unittest.TestCase):
         with self.assertRaises(InvalidOrderError):
             book.add_order(sell)
 
+    def test_tick_prices(self):
+        tick_size = TickSize('0.05')
+        self.assertEqual(tick_size.to_ticks('1025.05'), 20501)
+        self.assertEqual(tick_size.to_ticks(b'0.1'), 2)
+        self.assertEqual(tick_size.to_price(20501), 1025.05)
+        self.assertEqual(tick_size.midpoint(20500, 20502), 1025.05)
+        with self.assertRaises(ValueError):
+            TickSize('0')
+        for price in ('1025.06', 'inf', 'nan', '1e400'):
+            self.assertIsNone(tick_size.to_ticks(price))
+        self.assertEqual(TickSize().to_ticks('1025.0625'), 1025062500000)
+        self.assertIsNone(TickSize().to_ticks('nan'))
+
+    def test_off_tick_and_non_finite_prices_are_invalid(self):
+        from jump.feed_processor import MessageDispatcher
+        book = Book(tick_size=TickSize('0.01'))
+        dispatch = MessageDispatcher(book).dispatch
+        codes = [dispatch(row.split(',')) for row in ('A,1,S,5,inf', 'A,2,S,5,101.061', 'A,3,S,8,101.06',
+                                                      'M,3,S,8,nan', 'T,8,101.061', 'T,8,101.06')]
+        self.assertEqual(codes, ['f', 'f', None, 'f', 'f', None])
+        self.assertEqual(list(book.orders), [3])
+        self.assertEqual(book.last_trade_price, 10106)
+
+    def test_default_tick_size_keeps_feed_prices(self):
+        import io
+        from jump.__main__ import replay
+        from jump.feed_reader import csv_feed
+        out = io.StringIO()
+        book = Book(sink=TextSink(out))
+        replay(csv_feed(io.StringIO('A,1,S,5,100.125\nA,2,S,5,100.124\nA,3,B,5,100.001\nT,2,100.125\n'), book), book)
+        book.sink.flush()
+        self.assertEqual(out.getvalue(), 'NaN\nNaN\n100.06\n2@100.125\n100.06\nSELLS:\n100.12,5\n100.12,5\nBUYS:\n'
+                                         '100.00,5\n')
+        self.assertEqual(book.rejects.total(), 0)
+
+    def test_prices_are_written_to_the_tick(self):
+        import io
+        from jump.__main__ import replay
+        from jump.feed_reader import csv_feed
+        self.assertEqual([TickSize(tick).decimals for tick in (None, '0.01', '0.25', '0.001', '1/3')], [2, 2, 2, 3, 9])
+        out = io.StringIO()
+        tick_size = TickSize('0.001')
+        book = Book(sink=TextSink(out, decimals=tick_size.decimals), tick_size=tick_size)
+        replay(csv_feed(io.StringIO('A,1,S,5,100.125\nA,2,S,5,100.124\nA,3,B,5,100.001\nT,2,100.124\n'), book), book)
+        book.sink.flush()
+        self.assertEqual(out.getvalue(), 'NaN\nNaN\n100.062\n2@100.124\n100.062\nSELLS:\n100.125,5\n100.124,5\n'
+                                         'BUYS:\n100.001,5\n')
+
+    def test_depth_queries(self):
+        book = Book()
+        for order_id, side, price, quantity in ((1, 'B', 1000, 5), (2, 'B', 1000, 3), (3, 'B', 990, 4),
+                                                (4, 'S', 1025, 2), (5, 'S', 1030, 6)):
+            book.add_order(Order(id=order_id, side=side, price=price, quantity=quantity))
+        book.modify_order(Order(id=1, side='B', price=1000, quantity=2))
+        book.remove_order(Order(id=5, side='S', price=1030, quantity=1))
+        self.assertEqual(book.depth('B', 5), [(1000, 5, 2), (990, 4, 1)])
+        self.assertEqual(book.depth('S', 1), [(1025, 2, 1)])
+        self.assertEqual(book.cumulative_quantity('B', 995), 5)
+        self.assertEqual(book.cumulative_quantity('S', 1030), 7)
+        self.assertEqual(book.imbalance(), (5 - 2) / 7)
+        self.assertIsNone(Book().imbalance())
+
+    def test_level_aggregates_follow_the_orders(self):
+        from jump.feed_processor import MessageDispatcher
+        from jump.generator import FeedGenerator
+        book = Book(fill_trades=True)
+        dispatch = MessageDispatcher(book).dispatch
+        for message in FeedGenerator(seed=7, depth=5).messages(2000):
+            dispatch(message)
+        for ladder in (book.bids, book.asks):
+            for level in ladder:
+                self.assertEqual(level.quantity, sum(order.quantity for order in level))
+                self.assertEqual(level.count, len(list(level)))
+
+
+class TestSink(unittest.TestCase):
+    def populate(self, book):
+        book.add_order(Order(side='S', price=1025, id=1000, quantity=2, action='A'))
+        book.add_order(Order(side='S', price=1025, id=1001, quantity=5, action='A'))
+        book.midquote()
+        book.add_order(Order(side='B', price=1000, id=1002, quantity=3, action='A'))
+        book.midquote()
+        book.add_trade(Trade(price=1025, quantity=2))
+        book.output_state()
+
+    def test_text_sink_buffers(self):
+        import io
+        out = io.StringIO()
+        book = Book(sink=TextSink(out, buffer_size=1 << 10), tick_size=TickSize(1))
+        self.populate(book)
+        self.assertEqual(out.getvalue(), '')
+        book.sink.flush()
+        self.assertEqual(out.getvalue(), 'NaN\n1012.50\n2@1025.0\nSELLS:\n1025.00,2,5\nBUYS:\n1000.00,3\n')
+
+    def test_delta_snapshots(self):
+        import io
+        out = io.StringIO()
+        book = Book(sink=TextSink(out), full_snapshot_every=2, tick_size=TickSize(1))
+        book.add_order(Order(side='S', price=1030, id=1000, quantity=2, action='A'))
+        book.add_order(Order(side='B', price=1000, id=1001, quantity=3, action='A'))
+        book.add_order(Order(side='B', price=990, id=1002, quantity=4, action='A'))
+        book.snapshot()
+        book.apply_remove(1000, 'S', 2, 1030)
+        book.apply_modify(1001, 'B', 1, 1000)
+        book.snapshot()
+        book.snapshot()
+        book.sink.flush()
+        self.assertEqual(out.getvalue(), 'SELLS:\n1030.00,2\nBUYS:\n1000.00,3\n990.00,4\n'
+                                         'SELLS DELTA:\n1030.00,\nBUYS DELTA:\n1000.00,1\n'
+                                         'SELLS:\nBUYS:\n1000.00,1\n990.00,4\n')
+
+    def test_binary_sink_round_trip(self):
+        import io
+        from jump.sink import BinarySink, read_binary
+        out = io.BytesIO()
+        book = Book(sink=BinarySink(out, buffer_size=0), tick_size=TickSize(1))
+        self.populate(book)
+        book.sink.errors({'a': 1, 'd': 2})
+        self.assertEqual(list(read_binary(out.getvalue())), [
+            ('Q', None),
+            ('Q', 1012.5),
+            ('T', 2, 1025.0),
+            ('S', [(1025.0, [2, 5])], [(1000.0, [3])]),
+            ('E', {'a': 1, 'b': 0, 'c': 0, 'd': 2, 'e': 0, 'f': 0}),
+        ])
+
+    def test_conflating_sink(self):
+        import io
+        from jump.sink import ConflatingSink
+        out = io.StringIO()
+        sink = ConflatingSink(TextSink(out), changes_only=True, coalesce_trades=True)
+        for mid in (None, None, 1012.5, 1012.5, 1025.0, 1012.5):
+            sink.midquote(mid)
+        sink.trade(2, 1025.0)
+        sink.trade(3, 1025.0)
+        sink.trade(1, 1050.0)
+        sink.state([], [])
+        sink.trade(4, 1050.0)
+        sink.errors({})
+        sink.flush()
+        self.assertEqual(out.getvalue(), 'NaN\n1012.50\n1025.00\n1012.50\n3@1025.0\n1@1050.0\nSELLS:\nBUYS:\n'
+                                         '4@1050.0\nERRORS:\n')
+
+        out = io.StringIO()
+        sink = ConflatingSink(TextSink(out), changes_only=True, every=3)
+        for mid in (None, 1000.0, 1012.5, 1012.5, 1000.0, 1012.5, 1025.0):
+            sink.midquote(mid)
+        sink.errors({})
+        sink.flush()
+        # the windows end on 1012.50, 1012.50 again and, cut short by the end of the feed, 1025.00
+        self.assertEqual(out.getvalue(), '1012.50\n1025.00\nERRORS:\n')
+
+
+class TestFeedReader(unittest.TestCase):
+    FEED = 'A,1000,S,5,1025\r\nA,1001,B,5,1000\nBADMESSAGE\n\nT,2,1025\nM,1000,S,3,1025\nX,1001,B,5,1000\nX,9,B,1,1'
+
+    def replay(self, feed):
+        import io
+        out = io.StringIO()
+        book = Book(sink=TextSink(out))
+        errors = []
+        for code in feed(book):
+            errors.append(code)
+            book.midquote()
+        book.output_state()
+        book.sink.flush()
+        return out.getvalue(), errors
+
+    def test_csv_feed_yields_row_errors(self):
+        import io
+        from jump.feed_reader import csv_feed
+        _, errors = self.replay(lambda book: csv_feed(io.StringIO(self.FEED, newline=''), book))
+        self.assertEqual(errors, [None, None, 'a', 'a', None, None, None, 'd'])
+
+    def test_byte_lines_match_text_lines(self):
+        import io
+        from jump.feed_reader import ByteLines, FeedPosition, csv_feed
+        position = FeedPosition()
+        expected = self.replay(lambda book: csv_feed(io.StringIO(self.FEED, newline=''), book))
+        actual = self.replay(lambda book: csv_feed(ByteLines(io.BytesIO(self.FEED.encode()), position), book))
+        self.assertEqual(actual, expected)
+        self.assertEqual(actual[1].count('a'), 2)
+        self.assertEqual(position.offset, len(self.FEED))
+
+    def test_compressed_feeds(self):
+        import bz2
+        import gzip
+        import io
+        import lzma
+        import os
+        import tempfile
+        from jump.feed_reader import CHUNK_SIZE, ReadAhead, csv_feed, open_feed
+        expected = self.replay(lambda book: csv_feed(io.StringIO(self.FEED), book))
+        for compress in (gzip.compress, bz2.compress, lzma.compress):
+            fd, path = tempfile.mkstemp()
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compress(self.FEED.encode()))
+            try:
+                with open_feed(path) as f:
+                    self.assertEqual(self.replay(lambda book: csv_feed(f, book)), expected)
+                with open_feed(path, binary=True) as f:
+                    self.assertEqual(f.read(), self.FEED.encode())
+            finally:
+                os.remove(path)
+
+        # chunks smaller than a line, split inside a \r\n, and a reader closed before the end
+        stream = ReadAhead(io.BytesIO(self.FEED.encode()), chunk_size=16, read_ahead=2)
+        with io.TextIOWrapper(io.BufferedReader(stream, buffer_size=CHUNK_SIZE)) as f:
+            self.assertEqual(self.replay(lambda book: csv_feed(f, book)), expected)
+        stream = ReadAhead(io.BytesIO(self.FEED.encode() * 100), chunk_size=16, read_ahead=2)
+        self.assertEqual(stream.read(5), b'A,100')
+        stream.close()
+        self.assertFalse(stream.thread.is_alive())
+
+
+class TestShard(unittest.TestCase):
+    ROWS = [['X1', 'A', '1000', 'S', '5', '1025'], ['X2', 'A', '1000', 'B', '3', '1000'], ['BAD'],
+            ['X1', 'A', '1001', 'B', '2', '1000'], ['X2', 'T', '1', '1000'], ['X1', 'T', '2', '1025']]
+
+    def test_replay_symbols(self):
+        import io
+        from jump.shard import replay_symbols
+        out = io.StringIO()
+        counts = replay_symbols(self.ROWS, out, state=False)
+        self.assertEqual(out.getvalue(), 'SYMBOL,X1\nNaN\n1012.50\n2@1025.0\n1012.50\nSYMBOL,X2\nNaN\nNaN\n')
+        self.assertEqual(counts, {'a': 1, 'b': 0, 'c': 1, 'd': 0, 'e': 0, 'f': 0})
+
+    def test_replay_symbols_workers(self):
+        import io
+        from jump.shard import replay_symbols
+        expected = io.StringIO()
+        expected_counts = replay_symbols(self.ROWS, expected)
+        out = io.StringIO()
+        counts = replay_symbols(self.ROWS, out, workers=2)
+        self.assertEqual(out.getvalue(), expected.getvalue())
+        self.assertEqual(counts, expected_counts)
+
+    def test_spooled_sinks_buffer(self):
+        import tempfile
+        from jump.shard import SPOOL_BUFFER_SIZE, SymbolBooks
+        with tempfile.TemporaryDirectory() as spool_dir:
+            books = SymbolBooks(spool_dir, buffer_size=0)
+            self.assertEqual(books.open('X1').book.sink.buffer_size, SPOOL_BUFFER_SIZE)
+
+
+class TestGenerator(unittest.TestCase):
+    def test_seeded_feed_is_reproducible(self):
+        from jump.generator import FeedGenerator
+        first = list(FeedGenerator(seed=7).messages(500))
+        second = list(FeedGenerator(seed=7).messages(500))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, list(FeedGenerator(seed=8).messages(500)))
+
+    def test_clean_feed_replays_without_errors(self):
+        from jump.feed_processor import MessageDispatcher
+        from jump.generator import FeedGenerator
+        book = Book()
+        dispatch = MessageDispatcher(book).dispatch
+        for message in FeedGenerator(seed=3, depth=10).messages(2000):
+            dispatch(message)
+        book.check_expected_trades()
+        self.assertEqual(book.rejects.total(), 0)
+        self.assertTrue(book.orders)
+
+    def test_bad_rate(self):
+        from jump.generator import FeedGenerator
+        from jump.shard import SymbolBooks
+        books = SymbolBooks(None, state=False)
+        for message in FeedGenerator(seed=3, bad_rate=0.1).messages(2000):
+            books.apply('X', message)
+        counts = books.finish()
+        self.assertTrue(counts['a'] and counts['d'])
+        self.assertFalse(counts['b'] or counts['c'] or counts['f'])
+
+
+class TestStats(unittest.TestCase):
+    def test_histogram(self):
+        from jump.stats import Histogram
+        histogram = Histogram()
+        for ns in (100, 100, 100, 5000):
+            histogram.record(ns)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.percentile(50), 127)
+        self.assertEqual(histogram.percentile(100), 8191)
+        self.assertEqual(histogram.to_dict()['max_ns'], 5000)
+
+    def test_replay_stats(self):
+        import io
+        from jump.stats import Stats
+        feed = 'A,1000,S,5,1025\nA,1001,B,5,1000\nBADMESSAGE\nT,2,1025\nX,1001,B,5,1000\n'
+        out = io.StringIO()
+        book = Book(sink=TextSink(out))
+        stats = Stats(depth_interval=2)
+        stats.replay(stats.csv_feed(io.StringIO(feed), book), book)
+        result = stats.to_dict()
+        self.assertEqual(result['messages'], 5)
+        self.assertEqual({name: h['count'] for name, h in result['dispatch'].items()},
+                         {'A': 2, 'T': 1, 'X': 1, 'invalid': 1})
+        self.assertEqual(result['errors']['a'], 1)
+        self.assertEqual([sample['orders'] for sample in result['depth']], [2, 2, 1])
+
+
+class TestCheckpoint(unittest.TestCase):
+    FEED = (b'A,1000,S,5,1025\nA,1001,B,5,1000\nA,1002,S,3,1025\nBADMESSAGE\nT,2,1025\nM,1000,S,3,1025\n'
+            b'X,1001,B,5,1000\n')
+
+    def replay(self, book, f, position, count=None):
+        from jump.feed_reader import ByteLines, csv_feed
+        feed = csv_feed(ByteLines(f, position), book)
+        for _ in (feed if count is None else (next(feed) for _ in range(count))):
+            pass
+
+    def state(self, book):
+        import io
+        out = io.StringIO()
+        book.sink = TextSink(out)
+        book.output_state()
+        book.sink.flush()
+        return out.getvalue()
+
+    def test_resume_from_checkpoint(self):
+        import io
+        import os
+        import tempfile
+        from jump.checkpoint import Checkpointer, read_checkpoint
+        from jump.feed_reader import FeedPosition
+        expected = Book()
+        self.replay(expected, io.BytesIO(self.FEED), FeedPosition())
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            book = Book()
+            position = FeedPosition()
+            self.replay(book, io.BytesIO(self.FEED), position, count=5)
+            Checkpointer(path, 10, position).save(book, 5)
+            resumed = Book()
+            checkpoint = read_checkpoint(path, resumed)
+        finally:
+            os.remove(path)
+        self.assertEqual(checkpoint.messages, 5)
+        self.assertEqual(checkpoint.output_offset, -1)
+        self.assertEqual(self.state(resumed), self.state(book))
+        self.assertEqual(resumed.tick_size.to_price(resumed.last_trade_price), 1025)
+        self.assertEqual(resumed.rejects.counts['a'], 1)
+        self.assertEqual((resumed.tape.count, resumed.tape.volume_at(resumed.last_trade_price)), (1, 2))
+
+        f = io.BytesIO(self.FEED)
+        f.seek(checkpoint.input_offset)
+        self.replay(resumed, f, FeedPosition(checkpoint.input_offset))
+        self.assertEqual(self.state(resumed), self.state(expected))
+        self.assertEqual([order.id for order in resumed.asks.best()], [1000, 1002])
+        self.assertEqual(resumed.rejects.counts, expected.rejects.counts)
+
+
+class TestBatch(unittest.TestCase):
+    FEED = ('A,1000,S,5,1025\r\nA,1001,B,5,1000\nBADMESSAGE\n\nT,2,1025\nA,1002,Q,1,1000\nM,1000,S,3,1025\n'
+            'X,1001,B,5,1000\nT,9,1025\nA,1003,S,4,1030')
+
+    def test_batch_replay_matches_streaming(self):
+        import io
+        import os
+        import tempfile
+        from jump.batch import SeriesSink, batch_replay
+        from jump.feed_reader import csv_feed
+        book = Book(sink=SeriesSink())
+        for _ in csv_feed(io.StringIO(self.FEED, newline=''), book):
+            book.midquote()
+        expected = book.sink
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', newline='') as f:
+            f.write(self.FEED)
+        try:
+            for chunk_size in (7, 1 << 20):
+                batch_book = Book()
+                series = batch_replay(path, batch_book, chunk_size=chunk_size)
+                self.assertEqual(series.midquotes.tobytes(), expected.midquotes.tobytes())
+                self.assertEqual(list(series.trade_messages), [4])
+                self.assertEqual(list(series.trade_quantities), list(expected.trade_quantities))
+                self.assertEqual(list(series.trade_prices), [1025.0])
+                self.assertEqual(batch_book.rejects.counts, book.rejects.counts)
+        finally:
+            os.remove(path)
+
+
+class TestPipeline(unittest.TestCase):
+    FEED = 'A,1000,S,5,1025\nA,1001,B,5,1000\nBADMESSAGE\nT,2,1025\nM,1000,S,3,1025\nX,1001,B,5,1000\n' * 5
+
+    def run_replay(self, path, out, pipeline=None):
+        from jump.__main__ import replay, report_errors
+        from jump.feed_reader import csv_feed
+        from jump.pipeline import Pipeline
+        book = Book(full_snapshot_every=3)
+        if pipeline is None:
+            book.sink = TextSink(open(out, 'w'))
+            with open(path) as f:
+                replay(csv_feed(f, book), book)
+            report_errors(book.rejects, book.sink)
+            book.sink.flush()
+            book.sink.file.close()
+        else:
+            with Pipeline(path, out, use_process=pipeline == 'process', batch_size=4) as running:
+                book.sink = running.sink
+                replay(running.feed(book), book)
+                report_errors(book.rejects, book.sink)
+        with open(out) as f:
+            return f.read()
+
+    def test_pipeline_output_matches_sequential(self):
+        import os
+        import tempfile
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'feed.csv')
+        out = os.path.join(directory, 'out.txt')
+        with open(path, 'w') as f:
+            f.write(self.FEED)
+        try:
+            expected = self.run_replay(path, out)
+            self.assertIn('ERRORS:\na,5\n', expected)
+            for pipeline in ('thread', 'process'):
+                self.assertEqual(self.run_replay(path, out, pipeline), expected)
+        finally:
+            for name in (path, out):
+                os.remove(name)
+            os.rmdir(directory)
+
+
+class TestNetwork(unittest.TestCase):
+    FEED = TestPipeline.FEED
+
+    def test_tcp_publishers_match_file_replay(self):
+        import asyncio
+        import io
+        from jump.__main__ import replay, report_errors
+        from jump.feed_reader import csv_feed
+        from jump.network import AsyncWriter, FeedServer, publish
+
+        expected = io.StringIO()
+        book = Book(sink=TextSink(expected))
+        replay(csv_feed(io.StringIO(self.FEED), book), book)
+        report_errors(book.rejects, book.sink)
+        book.sink.flush()
+
+        async def run(feeds):
+            out = io.StringIO()
+            writer = AsyncWriter(out, limit=16)
+            server = FeedServer(Book(sink=TextSink(out, buffer_size=0)), writer=writer, queue_size=2, read_size=32)
+            server.book.sink.file = writer
+            await server.start(tcp_port=0)
+            await asyncio.gather(*(publish(*server.tcp_address, feed.encode(), chunk_size=7) for feed in feeds))
+            await server.wait_publishers(len(feeds))
+            await server.stop()
+            return server, out.getvalue()
+
+        server, output = asyncio.run(run([self.FEED]))
+        self.assertEqual(output, expected.getvalue())
+        self.assertEqual(server.messages, 30)
+
+        # a second publisher's bad rows interleave with the first one's, neither is lost
+        server, output = asyncio.run(run([self.FEED, 'BADMESSAGE\n' * 20]))
+        self.assertEqual(server.messages, 50)
+        self.assertIn('ERRORS:\na,25\nb,4\n', output)
+
+    def test_udp_datagrams(self):
+        import asyncio
+        import socket
+        from jump.network import FeedServer
+        from jump.sink import NullSink
+
+        async def run():
+            server = FeedServer(Book(sink=NullSink(), tick_size=TickSize('0.01')))
+            await server.start(udp_port=0)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                s.sendto(b'A,1000,S,5,1025\nA,1001,B,5,1000\n', server.udp_address)
+                s.sendto(b'T,2,1025\n', server.udp_address)
+            while server.messages < 3:
+                await asyncio.sleep(0.01)
+            await server.stop()
+            return server
+
+        server = asyncio.run(run())
+        self.assertEqual(server.book.tape.volume, 2)
+        self.assertEqual(server.book.best_bid(), 100000)
+        self.assertEqual(server.dropped, 0)
+
+
+class TestMerge(unittest.TestCase):
+    def test_merged_rows_follow_the_sequence(self):
+        import io
+        from jump.merge import merged_rows
+        gateway1 = io.StringIO('1,A,1000,S,5,1025\n4,T,2,1025\n4,X,1000,S,3,1025\n')
+        gateway2 = io.StringIO('2,A,1001,B,5,1000\nBAD\n3,M,1000,S,3,1025\n4,X,1001,B,5,1000\n')
+        self.assertEqual(list(merged_rows([gateway1, gateway2])), [
+            ['A', '1000', 'S', '5', '1025'],
+            ['A', '1001', 'B', '5', '1000'],
+            # a row without a sequence stays behind the row before it in its file
+            ['BAD'],
+            ['M', '1000', 'S', '3', '1025'],
+            # equal sequences are taken in the order the files were given
+            ['T', '2', '1025'],
+            ['X', '1000', 'S', '3', '1025'],
+            ['X', '1001', 'B', '5', '1000'],
+        ])
+
+    def test_merge_feed_matches_single_file(self):
+        import io
+        from jump.__main__ import replay
+        from jump.feed_reader import csv_feed
+        from jump.merge import merge_feed
+        rows = TestPipeline.FEED.splitlines()
+        partitions = ['', '', '']
+        for sequence, row in enumerate(rows):
+            partitions[sequence * 7 % 3] += '{},{}\n'.format(sequence, row)
+
+        expected = io.StringIO()
+        book = Book(sink=TextSink(expected))
+        replay(csv_feed(io.StringIO(TestPipeline.FEED), book), book)
+        book.sink.flush()
+        merged = io.StringIO()
+        book = Book(sink=TextSink(merged))
+        replay(merge_feed([io.StringIO(partition) for partition in partitions], book), book)
+        book.sink.flush()
+        self.assertEqual(merged.getvalue(), expected.getvalue())
+
+
+class TestEvents(unittest.TestCase):
+    def test_book_events(self):
+        from jump.events import LevelUpdate, Midquote, Reject, TradePrint, book_events
+        rows = [row.split(',') for row in ('A,1000,S,5,1025', 'A,1001,B,5,1000', 'BADMESSAGE', 'T,2,1025',
+                                            'A,1002,B,1,1000', 'M,1000,S,3,1020', 'X,1001,B,5,1000')]
+        book = Book(tick_size=TickSize(1))
+        self.assertEqual(list(book_events(rows, book)), [
+            LevelUpdate(0, 'S', 1025, 5, 1),
+            LevelUpdate(1, 'B', 1000, 5, 1),
+            Midquote(1, 1000, 1025),
+            Reject(2, 'a', ['BADMESSAGE']),
+            TradePrint(3, 1025, 2, 2),
+            # a new order at an unchanged best price moves the level but not the midquote
+            LevelUpdate(4, 'B', 1000, 6, 2),
+            LevelUpdate(5, 'S', 1025, 0, 0),
+            LevelUpdate(5, 'S', 1020, 3, 1),
+            Midquote(5, 1000, 1020),
+            LevelUpdate(6, 'B', 1000, 1, 1),
+        ])
+        self.assertEqual(Midquote(5, 1000, 1020).mid, 1010)
+        self.assertEqual(book.rejects.counts['a'], 1)
+
+        events = list(book_events([['A', '1', 'B', '5', '1030'], ['A', '2', 'S', '5', '1030']],
+                                  Book(tick_size=TickSize('0.01')), levels=False))
+        self.assertEqual(events, [Midquote(1, 103000, 103000), Reject(2, 'e', None)])
+
 
 if __name__ == '__main__':
     unittest.main()